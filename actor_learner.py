@@ -0,0 +1,188 @@
+"""
+Actor/learner DQN training. Actor processes play batches of self-play games
+(BatchChessEnv) with a local copy of the policy network, and send their
+transitions in compact chunks (piece codes and legal-action lists, not
+observations and masks) through a queue. The learner (the calling process)
+fills the replay buffer from the queue and runs optimize_model without
+waiting on the games. Every sync_every updates it publishes its weights to
+a shared-memory network that the actors copy from.
+
+    python actor_learner.py --actors 7 --updates 20000
+"""
+import argparse
+import os
+import queue
+import random
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from agent import ChessDQN, DQNAgent, ReplayBuffer
+from chess_env import BatchChessEnv, observation_to_codes
+from replay_store import ReplayStore
+
+TRANSITION_CHUNK = 256  # transitions per queue message
+MAX_EPISODE_MOVES = 300  # self-play games are cut off after this many moves
+GAMES_PER_ACTOR = 16  # games each actor plays side by side
+QUEUE_CHUNKS = 64  # actors block once this many chunks are waiting
+
+
+def actor_epsilon(actor_id: int, num_actors: int, base: float = 0.4, alpha: float = 7.0) -> float:
+    """Fixed exploration rate per actor, from mostly random to mostly greedy."""
+    return base ** (1 + alpha * actor_id / max(num_actors - 1, 1))
+
+
+def _put(transitions, item, stop) -> None:
+    while not stop.is_set():
+        try:
+            transitions.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _send_chunk(transitions, chunk, stop) -> None:
+    boards, white_to_move, actions, rewards, next_boards, next_white_to_move, dones, next_legal = zip(*chunk)
+    # The legal actions of all next states back to back, with their counts
+    _put(transitions, ("transitions", np.stack(boards), np.array(white_to_move), np.array(actions, dtype=np.int16),
+                       np.array(rewards, dtype=np.float32), np.stack(next_boards), np.array(next_white_to_move),
+                       np.array(dones), np.concatenate(next_legal).astype(np.int16),
+                       np.array([len(legal) for legal in next_legal])), stop)
+
+
+def run_actor(actor_id: int, shared_net: ChessDQN, weights_lock, transitions, stop,
+              epsilon: float, sync_every: int, seed: int, num_games: int = GAMES_PER_ACTOR) -> None:
+    """
+    Self-play loop of one actor process, until stop is set. The actor plays
+    num_games games at once so each move of all of them is one batched forward pass.
+    """
+    torch.set_num_threads(1)  # one core per actor
+    random.seed(seed)
+    np.random.seed(seed)
+    agent = DQNAgent()
+    with weights_lock:
+        agent.policy_net.load_state_dict(shared_net.state_dict())
+    env = BatchChessEnv(num_games, max_moves=MAX_EPISODE_MOVES)
+    observations = env.reset()
+    # Transitions of each game, sent game by game so the replay buffer can share their states
+    pending = [[] for _ in range(num_games)]
+    total_rewards = np.zeros(num_games)
+    steps = last_sync = 0
+    while not stop.is_set():
+        boards, white_to_move = env.boards.copy(), env.white_to_move.copy()
+        actions = agent.select_actions(observations, env.action_masks, epsilon)
+        observations, rewards, dones, info = env.step(actions)
+        # Finished games have already been reset, their next states are the final ones
+        next_boards, next_white_to_move = env.boards.copy(), env.white_to_move.copy()
+        next_legal = [np.flatnonzero(mask) for mask in info["action_mask"]]
+        finished = np.flatnonzero(dones | info["truncated"])
+        for j, i in enumerate(finished):
+            next_boards[i], next_white_to_move[i] = observation_to_codes(info["final_observation"][j])
+            next_legal[i] = np.flatnonzero(info["final_action_mask"][j])
+        for i in range(num_games):
+            pending[i].append((boards[i], white_to_move[i], actions[i], rewards[i],
+                               next_boards[i], next_white_to_move[i], dones[i], next_legal[i]))
+        total_rewards += rewards
+        for i in finished:
+            _put(transitions, ("episode", actor_id, float(total_rewards[i])), stop)
+            total_rewards[i] = 0.0
+        steps += num_games
+        if len(pending[0]) * num_games >= TRANSITION_CHUNK:
+            _send_chunk(transitions, [transition for game in pending for transition in game], stop)
+            pending = [[] for _ in range(num_games)]
+        if steps - last_sync >= sync_every:
+            with weights_lock:
+                agent.policy_net.load_state_dict(shared_net.state_dict())
+            last_sync = steps
+
+
+def _drain(transitions, replay_buffer, episode_rewards, timeout=None) -> int:
+    """Move everything waiting in the queue into the replay buffer, return the transitions added."""
+    added = 0
+    while True:
+        try:
+            item = transitions.get(timeout=timeout) if timeout else transitions.get_nowait()
+        except queue.Empty:
+            return added
+        timeout = None
+        if item[0] == "episode":
+            episode_rewards.append(item[2])
+            continue
+        *columns, legal_actions, legal_counts = item[1:]
+        next_legal = np.split(legal_actions, np.cumsum(legal_counts)[:-1])
+        for transition in zip(*columns, next_legal):
+            replay_buffer.push_codes(*transition)
+        added += len(item[1])
+
+
+def train_actor_learner(num_actors=None, num_updates=10000, batch_size=64, target_update=1000,
+                        sync_every=200, actor_sync_every=1000, replay_capacity=1_000_000, replay_dir=None):
+    """
+    Train with num_actors self-play processes (default: one per core besides the
+    learner) for num_updates gradient steps. Returns the agent and the rewards of
+    the finished self-play episodes.
+    """
+    num_actors = num_actors or max((os.cpu_count() or 2) - 1, 1)
+    ctx = mp.get_context("spawn")
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    agent = DQNAgent(device=device)
+    replay_buffer = ReplayStore(replay_dir) if replay_dir else ReplayBuffer(capacity=replay_capacity)
+    shared_net = ChessDQN()
+    shared_net.load_state_dict(agent.policy_net.state_dict())
+    shared_net.share_memory()
+    weights_lock = ctx.Lock()
+    transitions = ctx.Queue(maxsize=QUEUE_CHUNKS)
+    stop = ctx.Event()
+    actors = [ctx.Process(target=run_actor, daemon=True,
+                          args=(i, shared_net, weights_lock, transitions, stop,
+                                actor_epsilon(i, num_actors), actor_sync_every, random.randrange(1 << 30)))
+              for i in range(num_actors)]
+    for actor in actors:
+        actor.start()
+
+    episode_rewards = []
+    updates = 0
+    received = 0
+    start_time = time.time()
+    try:
+        while updates < num_updates:
+            received += _drain(transitions, replay_buffer, episode_rewards)
+            if agent.optimize_model(replay_buffer, batch_size) is None:
+                # Not enough data to train on yet, wait for the actors
+                received += _drain(transitions, replay_buffer, episode_rewards, timeout=1.0)
+                continue
+            updates += 1
+            if updates % sync_every == 0:
+                with weights_lock:
+                    shared_net.load_state_dict(agent.policy_net.state_dict())
+            if updates % target_update == 0:
+                agent.update_target()
+            if updates % 1000 == 0:
+                elapsed = time.time() - start_time
+                recent = episode_rewards[-100:]
+                print(f"Updates {updates}: {received / elapsed:.0f} transitions/sec, {updates / elapsed:.0f} updates/sec, "
+                      f"{len(episode_rewards)} episodes, mean reward {np.mean(recent) if recent else 0.0:.2f}")
+    finally:
+        stop.set()
+        for actor in actors:
+            while actor.is_alive():
+                _drain(transitions, replay_buffer, episode_rewards)  # unblock actors stuck on a full queue
+                actor.join(timeout=0.1)
+        if replay_dir:
+            replay_buffer.close()
+    return agent, episode_rewards
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Actor/learner self-play DQN training.")
+    parser.add_argument("--actors", type=int, default=None, help="self-play processes (default: cores - 1)")
+    parser.add_argument("--updates", type=int, default=10000, help="gradient steps to train for")
+    parser.add_argument("--replay-dir", default=None, help="keep the transitions in a disk-backed ReplayStore")
+    parser.add_argument("--output", default="chess_dqn_model.pth")
+    args = parser.parse_args(argv)
+    agent, _ = train_actor_learner(args.actors, args.updates, replay_dir=args.replay_dir)
+    torch.save(agent.policy_net.state_dict(), args.output)
+
+
+if __name__ == "__main__":
+    main()
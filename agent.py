@@ -3,8 +3,10 @@ import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 import random
-from collections import deque
 from chess_env import ChessEnv  # Import the modified chess environment with dense rewards
+from chess_env import (observation_to_codes, codes_to_observations, legal_action_masks, ALL_ACTIONS,
+                       LEGAL_ACTIONS_PER_STATE)
+from replay_store import ReplayStore
 
 # ----------------------------
 # Neural Network for DQN
@@ -31,24 +33,123 @@ class ChessDQN(nn.Module):
     def forward(self, x):
         return self.model(x)
 
+def masked_greedy_actions(net, states, action_masks, device=torch.device("cpu")):
+    """
+    Best legal action of each state by one forward pass over the whole batch.
+    states: [N, 833] observations, action_masks: [N, 4096] bool legal actions.
+    Returns an int64 numpy array [N].
+    """
+    states = torch.as_tensor(np.asarray(states, dtype=np.float32), device=device)
+    masks = torch.tensor(action_masks, dtype=torch.bool, device=device)
+    with torch.no_grad():
+        return net(states).masked_fill(~masks, -float("inf")).argmax(1).cpu().numpy()
+
 # ----------------------------
 # Replay Buffer for Experience Replay
 # ----------------------------
 class ReplayBuffer:
+    """
+    Ring buffer of transitions in preallocated arrays. Boards are stored as 64
+    uint8 piece codes plus the side to move, and a transition's next_state is the
+    state stored in the following slot, so consecutive transitions of a game share
+    it. Push the transitions of each game in order: a state that does not
+    continue the previous next_state starts a new trajectory.
+    The legal actions of each slot's state are kept as a list of action indices
+    in a ring of LEGAL_ACTIONS_PER_STATE entries per slot, found by the slot's
+    offset and count, so the target can leave out illegal next-state actions;
+    states pushed without a mask allow every action. A slot takes about 180
+    bytes (180 MB at capacity 1_000_000). Should the states average more legal
+    actions than LEGAL_ACTIONS_PER_STATE, the lists of the oldest ones are
+    overwritten first and their transitions are no longer sampled.
+    """
     def __init__(self, capacity=10000):
         self.capacity = capacity
-        self.buffer = deque(maxlen=capacity)
+        self.boards = np.zeros((capacity, 64), dtype=np.uint8)
+        self.white_to_move = np.zeros(capacity, dtype=bool)
+        self.actions = np.zeros(capacity, dtype=np.int16)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.legal_actions = np.zeros(capacity * LEGAL_ACTIONS_PER_STATE, dtype=np.int16)
+        self.legal_offsets = np.zeros(capacity, dtype=np.int64)  # into legal_actions, counted from the first push
+        self.legal_counts = np.zeros(capacity, dtype=np.int16)
+        self.legal_end = 0  # legal actions written so far
+        # Slots whose transition is complete (the following slot holds its next state)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.pos = 0  # slot of the last pushed next_state
+        self.size = 0  # slots written so far, up to capacity
+        self.count = 0  # complete transitions
+        self.last_done = True
+    
+    def _store_state(self, slot, board, white_to_move, legal_actions):
+        self.boards[slot] = board
+        self.white_to_move[slot] = white_to_move
+        if legal_actions is None:
+            self.legal_counts[slot] = ALL_ACTIONS
+        else:
+            count = len(legal_actions)
+            self.legal_actions[(self.legal_end + np.arange(count)) % len(self.legal_actions)] = legal_actions
+            self.legal_offsets[slot] = self.legal_end
+            self.legal_counts[slot] = count
+            self.legal_end += count
+        if self.valid[slot]:  # overwriting the oldest transition
+            self.valid[slot] = False
+            self.count -= 1
+        self.size = min(self.size + 1, self.capacity)
     
-    def push(self, state, action, reward, next_state, done):
-        self.buffer.append((state, action, reward, next_state, done))
+    def push(self, state, action, reward, next_state, done, next_action_mask=None):
+        """next_action_mask: bool [4096] legal actions of next_state, if known."""
+        next_legal_actions = None if next_action_mask is None else np.flatnonzero(next_action_mask)
+        self.push_codes(*observation_to_codes(state), action, reward, *observation_to_codes(next_state), done,
+                        next_legal_actions)
+    
+    def push_codes(self, board, white_to_move, action, reward, next_board, next_white_to_move, done,
+                   next_legal_actions=None):
+        """push, with both states given as piece codes and side to move, and the legal actions as indices."""
+        slot = self.pos
+        if self.last_done or not (np.array_equal(self.boards[slot], board)
+                                  and self.white_to_move[slot] == white_to_move):
+            if self.size:  # keep the previous next_state, it ends its trajectory
+                slot = (slot + 1) % self.capacity
+            self._store_state(slot, board, white_to_move, None)
+        self.actions[slot] = action
+        self.rewards[slot] = reward
+        self.dones[slot] = done
+        self.pos = (slot + 1) % self.capacity
+        self._store_state(self.pos, next_board, next_white_to_move, next_legal_actions)
+        self.valid[slot] = True
+        self.count += 1
+        self.last_done = done
+    
+    def _decode(self, slots):
+        return codes_to_observations(self.boards[slots], self.white_to_move[slots])
     
     def sample(self, batch_size):
-        batch = random.sample(self.buffer, batch_size)
-        state, action, reward, next_state, done = map(np.array, zip(*batch))
-        return state, action, reward, next_state, done
+        """Random transitions as arrays ready for torch.from_numpy."""
+        slots = np.empty(0, dtype=np.int64)
+        while len(slots) < batch_size:  # nearly every slot is valid, rejection is cheap
+            candidates = np.random.randint(0, self.size, size=2 * batch_size)
+            slots = np.concatenate([slots, candidates[self._complete(candidates)]])
+        slots = slots[:batch_size]
+        next_slots = (slots + 1) % self.capacity
+        return (self._decode(slots), self.actions[slots].astype(np.int64), self.rewards[slots],
+                self._decode(next_slots), self.dones[slots].astype(np.float32), self._legal_action_masks(next_slots))
+    
+    def _complete(self, slots):
+        """Valid transitions whose next state still has its legal actions."""
+        next_slots = (slots + 1) % self.capacity
+        return self.valid[slots] & ((self.legal_counts[next_slots] == ALL_ACTIONS)
+                                    | (self.legal_offsets[next_slots] >= self.legal_end - len(self.legal_actions)))
+    
+    def _legal_action_masks(self, slots):
+        counts = self.legal_counts[slots]
+        lengths = np.maximum(counts, 0).astype(np.int64)
+        # Offset of each listed action: its slot's offset plus its place in the list
+        starts = np.repeat(self.legal_offsets[slots] - (np.cumsum(lengths) - lengths), lengths)
+        indices = (starts + np.arange(lengths.sum())) % len(self.legal_actions)
+        return legal_action_masks(self.legal_actions[indices], counts)
     
     def __len__(self):
-        return len(self.buffer)
+        return self.count
 
 # ----------------------------
 # DQN Agent
@@ -68,39 +169,51 @@ class DQNAgent:
         """Copy the policy network weights into the target network."""
         self.target_net.load_state_dict(self.policy_net.state_dict())
     
-    def select_action(self, state, valid_actions, epsilon):
+    def select_action(self, state, action_mask, epsilon):
         """
         Choose an action using an epsilon-greedy policy over valid actions.
         - state: current state as a numpy array.
-        - valid_actions: list of action indices corresponding to legal moves.
+        - action_mask: bool [4096] array of the legal actions (ChessEnv.action_mask).
         - epsilon: exploration rate.
         """
-        state_tensor = torch.FloatTensor(state).unsqueeze(0).to(self.device)
         if random.random() < epsilon:
-            return random.choice(valid_actions)
+            return int(random.choice(np.flatnonzero(action_mask)))
+        # Only consider valid actions
+        return int(masked_greedy_actions(self.policy_net, np.expand_dims(state, 0), np.expand_dims(action_mask, 0),
+                                         self.device)[0])
+    
+    def select_actions(self, states, action_masks, epsilon):
+        """
+        select_action for a batch of states [N, 833] with action_masks [N, 4096],
+        in a single forward pass. Each state explores with probability epsilon.
+        """
+        explore = np.random.random(len(states)) < epsilon
+        if explore.all():
+            actions = np.empty(len(states), dtype=np.int64)
         else:
-            with torch.no_grad():
-                q_values = self.policy_net(state_tensor).cpu().data.numpy().flatten()
-            # Only consider valid actions
-            valid_q = [(action, q_values[action]) for action in valid_actions]
-            best_action = max(valid_q, key=lambda x: x[1])[0]
-            return best_action
+            actions = masked_greedy_actions(self.policy_net, states, action_masks, self.device)
+        for i in np.flatnonzero(explore):
+            actions[i] = np.random.choice(np.flatnonzero(action_masks[i]))
+        return actions
     
     def optimize_model(self, replay_buffer, batch_size):
         if len(replay_buffer) < batch_size:
             return None
-        states, actions, rewards, next_states, dones = replay_buffer.sample(batch_size)
-        states = torch.FloatTensor(states).to(self.device)
-        actions = torch.LongTensor(actions).unsqueeze(1).to(self.device)
-        rewards = torch.FloatTensor(rewards).unsqueeze(1).to(self.device)
-        next_states = torch.FloatTensor(next_states).to(self.device)
-        dones = torch.FloatTensor(dones).unsqueeze(1).to(self.device)
+        states, actions, rewards, next_states, dones, next_masks = replay_buffer.sample(batch_size)
+        states = torch.from_numpy(states).to(self.device)
+        actions = torch.from_numpy(actions).unsqueeze(1).to(self.device)
+        rewards = torch.from_numpy(rewards).unsqueeze(1).to(self.device)
+        next_states = torch.from_numpy(next_states).to(self.device)
+        dones = torch.from_numpy(dones).unsqueeze(1).to(self.device)
+        next_masks = torch.from_numpy(next_masks).to(self.device)
         
         # Compute Q(s,a) for the current state
         current_q = self.policy_net(states).gather(1, actions)
-        # Compute max Q-value for next state from target network
+        # Compute max Q-value over the legal actions of the next state from target network
         with torch.no_grad():
-            max_next_q = self.target_net(next_states).max(1)[0].unsqueeze(1)
+            next_q = self.target_net(next_states).masked_fill(~next_masks, -float("inf"))
+            # A state without legal moves is terminal, keep its -inf out of the product
+            max_next_q = next_q.max(1)[0].unsqueeze(1).nan_to_num(neginf=0.0)
             target_q = rewards + self.gamma * max_next_q * (1 - dones)
         
         loss = nn.MSELoss()(current_q, target_q)
@@ -113,36 +226,34 @@ class DQNAgent:
 # Training Loop
 # ----------------------------
 def train_dqn(num_episodes=1000, batch_size=64, target_update=10,
-              epsilon_start=1.0, epsilon_end=0.1, epsilon_decay=0.995):
+              epsilon_start=1.0, epsilon_end=0.1, epsilon_decay=0.995, replay_dir=None):
+    """
+    Train a DQN agent by self-play. With replay_dir the transitions go to a
+    disk-backed ReplayStore there, which later runs reopen and keep learning from.
+    """
     env = ChessEnv()
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     agent = DQNAgent(device=device)
-    replay_buffer = ReplayBuffer(capacity=10000)
+    replay_buffer = ReplayStore(replay_dir) if replay_dir else ReplayBuffer(capacity=1_000_000)
     epsilon = epsilon_start
     episode_rewards = []
     
     for i_episode in range(num_episodes):
-        state = env.reset()
+        state = env.reset().copy()  # the env overwrites its observation in place
         total_reward = 0.0
         done = False
         
-        # Get valid actions for the initial state from the game engine
-        valid_moves = env.game.get_valid_moves()
-        valid_actions = [env.move_to_action_index(m) for m in valid_moves]
-        
         while not done:
-            action = agent.select_action(state, valid_actions, epsilon)
+            action = agent.select_action(state, env.action_mask, epsilon)
             next_state, reward, done, info = env.step(action)
             total_reward += reward
-            replay_buffer.push(state, action, reward, next_state, done)
-            state = next_state
-            
-            # Update valid actions based on the new game state
-            valid_moves = env.game.get_valid_moves()
-            valid_actions = [env.move_to_action_index(m) for m in valid_moves]
+            replay_buffer.push(state, action, reward, next_state, done, info["action_mask"])
+            state = next_state.copy()
             
             agent.optimize_model(replay_buffer, batch_size)
         
+        if replay_dir:
+            replay_buffer.flush()
         epsilon = max(epsilon_end, epsilon * epsilon_decay)
         episode_rewards.append(total_reward)
         if i_episode % target_update == 0:
@@ -1,157 +1,515 @@
 import random
+import threading
 import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 from chess_engine import GameState, Move
+from evaluation import pieceScore
+from opening_book import OpeningBook
+from search_stats import SearchStats
+from tablebase import Tablebases
+from transposition_table import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, DEPTH, BOUND, SCORE, MOVE_ID
 
-# Piece evaluation scores
-pieceScore = {"K": 0, "Q": 90, "R": 50, "B": 35, "N": 30, "p": 10}
-
-# Position score matrices for non-king pieces
-knightScore = [[1, 1, 1, 1, 1, 1, 1, 1],
-               [1, 2, 2, 2, 2, 2, 2, 1],
-               [1, 2, 3, 3, 3, 3, 2, 1],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [1, 2, 3, 3, 3, 3, 2, 1],
-               [1, 2, 2, 2, 2, 2, 2, 1],
-               [1, 1, 1, 1, 1, 1, 1, 1]]
-
-bishopScore = [[4, 3, 2, 1, 1, 2, 3, 4],
-               [3, 4, 3, 2, 2, 3, 4, 3],
-               [2, 3, 4, 3, 3, 4, 3, 2],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [2, 3, 4, 3, 3, 4, 3, 2],
-               [3, 4, 3, 2, 2, 3, 4, 3],
-               [4, 3, 2, 1, 1, 2, 3, 4]]
-
-queenScore = [[1, 1, 1, 3, 1, 1, 1, 1],
-              [1, 2, 3, 3, 3, 1, 1, 1],
-              [1, 4, 3, 3, 3, 4, 2, 1],
-              [1, 2, 3, 3, 3, 2, 2, 1],
-              [1, 2, 3, 3, 3, 2, 2, 1],
-              [1, 4, 3, 3, 3, 4, 2, 1],
-              [1, 2, 3, 3, 3, 1, 1, 1],
-              [1, 1, 1, 3, 1, 1, 1, 1]]
-
-rookScore = [[4, 3, 4, 4, 4, 4, 3, 4],
-             [4, 4, 4, 4, 4, 4, 4, 4],
-             [1, 1, 2, 3, 3, 2, 1, 1],
-             [1, 2, 3, 4, 4, 3, 2, 1],
-             [1, 2, 3, 4, 4, 3, 2, 1],
-             [1, 1, 2, 3, 3, 2, 1, 1],
-             [4, 4, 4, 4, 4, 4, 4, 4],
-             [4, 3, 4, 4, 4, 4, 3, 4]]
-
-whitePawnScore = [[8, 8, 8, 8, 8, 8, 8, 8],
-                  [8, 8, 8, 8, 8, 8, 8, 8],
-                  [5, 6, 6, 7, 7, 6, 6, 5],
-                  [2, 3, 3, 5, 5, 3, 3, 2],
-                  [1, 2, 3, 4, 4, 3, 2, 1],
-                  [1, 2, 3, 3, 3, 3, 2, 1],
-                  [1, 1, 1, 0, 0, 1, 1, 1],
-                  [0, 0, 0, 0, 0, 0, 0, 0]]
-
-blackPawnScore = [[0, 0, 0, 0, 0, 0, 0, 0],
-                  [1, 1, 1, 0, 0, 1, 1, 1],
-                  [1, 2, 3, 3, 3, 3, 2, 1],
-                  [1, 2, 3, 4, 4, 3, 2, 1],
-                  [2, 3, 3, 5, 5, 3, 3, 2],
-                  [5, 6, 6, 7, 7, 6, 6, 5],
-                  [8, 8, 8, 8, 8, 8, 8, 8],
-                  [8, 8, 8, 8, 8, 8, 8, 8]]
-
-piecePosScores = {
-    'N': knightScore,
-    'B': bishopScore,
-    'Q': queenScore,
-    'R': rookScore,
-    "wp": whitePawnScore,
-    "bp": blackPawnScore
-}
+# Move ordering: attacker values for MVV-LVA (the king is the least desirable attacker)
+attackerOrder = {"p": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+TT_MOVE_ORDER = 1 << 30
+CAPTURE_ORDER = 1 << 20
+KILLER_ORDER = (CAPTURE_ORDER - 1, CAPTURE_ORDER - 2)
+HISTORY_MAX = CAPTURE_ORDER - 3  # quiet moves always rank below killers
 
 check_mate = 100000
 stale_mate = 0
-MAX_DEPTH = 4
+TABLEBASE_WIN = check_mate // 2  # tablebase wins score this minus the plies to mate
+MAX_DEPTH = 3  # leaves are resolved by quiescence search, so one ply less is enough
+# Quiescence search: skip captures that cannot lift the score back to alpha even with this
+# margin, and search all check evasions (not just captures) when in check
+DELTA_MARGIN = 20
+QUIESCENCE_CHECK_EVASIONS = True
+MAX_ITERATIVE_DEPTH = 64  # depth cap when the search is bounded by time or nodes instead
+BUDGET_CHECK_MASK = 127  # check the time/node budget and cancellation once every 128 nodes
 
-next_move = None
-nodes = 0
+# Defaults of find_best_move_minimax / search_best_move, which share one Searcher
+opening_book = None  # OpeningBook consulted before searching, see load_opening_book
+tablebases = None  # Tablebases probed by the search, see load_tablebases
+default_searcher = None
+
+def load_opening_book(path: str) -> None:
+    """Use the book file at path (built with opening_book.py) for all later searches."""
+    global opening_book
+    if opening_book is not None:
+        opening_book.close()
+    opening_book = OpeningBook(path)
+
+def load_tablebases(directory: str) -> None:
+    """Probe the endgame tables in directory (built with tablebase.py) from now on."""
+    global tablebases
+    tablebases = Tablebases.load(directory)
+
+def tablebase_score(gs: GameState, tables: Optional[Tablebases]) -> Optional[int]:
+    """Exact score of a position the tablebases cover (faster mates score higher), otherwise None."""
+    if tables is None:
+        return None
+    result = tables.probe(gs)
+    if result is None:
+        return None
+    outcome, plies = result
+    score = outcome * (TABLEBASE_WIN - plies)
+    return score if gs.white_to_move else -score
 
 def find_random_move(valid_moves: list) -> Move:
     """Return a random move from the list of valid moves."""
     return random.choice(valid_moves) if valid_moves else None
 
-def find_best_move_minimax(gs: GameState, valid_moves: list) -> Move:
+def find_best_move_minimax(gs: GameState, valid_moves: list, time_limit: float = None,
+                           max_nodes: int = None, max_depth: int = None, randomize: bool = False,
+                           workers: int = None) -> Move:
     """
     Use the minimax algorithm with alpha-beta pruning to find the best move.
+    Searches depth 1, 2, 3, ... (iterative deepening) until max_depth is reached or
+    the time limit (seconds) or node budget runs out, and returns the best move of
+    the last completed iteration. Without any limit it searches to MAX_DEPTH.
+    randomize breaks ties between equally ordered moves at random to vary play.
+    With workers > 1 the root moves are searched in that many processes (the node
+    budget and randomize do not apply there).
+    Positions found in the opening book or the tablebases are answered from them without searching.
+    Prints a summary of the search, use search_best_move for the statistics themselves.
     """
-    global next_move, nodes
-    next_move = None
-    alpha = -check_mate
-    beta = check_mate
-    nodes = 0
-    start_time = time.time()
-    find_move_minimax(gs, valid_moves, MAX_DEPTH, alpha, beta, gs.white_to_move)
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    print(f"Elapsed time: {elapsed_time:.2f} sec, nodes: {nodes}")
-    return next_move
-
-def find_move_minimax(gs: GameState, valid_moves: list, depth: int, alpha: int, beta: int, white_to_move: bool) -> int:
-    global next_move, nodes
-    nodes += 1
-    if depth == 0 or gs.check_mate or gs.stale_mate:
-        return score_board(gs)
-    random.shuffle(valid_moves)
-    if white_to_move:
-        max_score = -check_mate
-        for move in valid_moves:
-            gs.make_move(move)
-            score = find_move_minimax(gs, gs.get_valid_moves(), depth - 1, alpha, beta, False)
-            gs.undo_move()
-            if score > max_score:
-                max_score = score
-                if depth == MAX_DEPTH:
-                    next_move = move
-            alpha = max(alpha, score)
-            if beta <= alpha:
-                break
-        return max_score
-    else:
-        min_score = check_mate
-        for move in valid_moves:
-            gs.make_move(move)
-            score = find_move_minimax(gs, gs.get_valid_moves(), depth - 1, alpha, beta, True)
-            gs.undo_move()
-            if score < min_score:
-                min_score = score
-                if depth == MAX_DEPTH:
-                    next_move = move
-            beta = min(beta, score)
-            if beta <= alpha:
-                break
-        return min_score
+    best_move, stats = search_best_move(gs, valid_moves, time_limit, max_nodes, max_depth, randomize, workers)
+    print(stats.summary())
+    return best_move
+
+def search_best_move(gs: GameState, valid_moves: list, time_limit: float = None,
+                     max_nodes: int = None, max_depth: int = None, randomize: bool = False,
+                     workers: int = None, on_iteration=None, on_search=None) -> Tuple[Move, SearchStats]:
+    """
+    find_best_move_minimax returning (best move, SearchStats) instead of printing.
+    on_iteration is called with the statistics so far after every completed
+    depth and on_search with the final ones (search_stats.JsonLogSink logs them).
+    Both functions run on one shared Searcher; searches that run at the same
+    time or need cancelling should each use a Searcher of their own.
+    """
+    global default_searcher
+    if default_searcher is None:
+        default_searcher = Searcher()
+    default_searcher.opening_book = opening_book
+    default_searcher.tablebases = tablebases
+    default_searcher.workers = workers
+    result = default_searcher.search(gs, valid_moves, time_limit, max_nodes, max_depth, randomize,
+                                     on_iteration=on_iteration, on_search=on_search)
+    return result.move, result.stats
 
-def score_board(gs: GameState) -> int:
+def material_gain(move: Move) -> int:
+    """Material won by a capture or promotion, in pieceScore units."""
+    gain = pieceScore[move.piece_captured[1]] if move.is_capture else 0
+    if move.is_pawn_promotion:
+        gain += pieceScore["Q"] - pieceScore["p"]
+    return gain
+
+def mvv_lva(move: Move) -> int:
+    """Most valuable victim first, least valuable attacker breaks ties."""
+    return material_gain(move) * 8 - attackerOrder[move.piece_move[1]]
+
+def score_board(gs: GameState, tables: Optional[Tablebases] = None) -> int:
     """
     Evaluate the board. Positive score favors white, negative favors black.
+    Positions the given tablebases cover get their exact score.
     """
     if gs.check_mate:
         return -check_mate if gs.white_to_move else check_mate
     elif gs.stale_mate:
         return stale_mate
-    score = 0
-    for r in range(8):
-        for c in range(8):
-            piece = gs.board[r][c]
-            if piece != "--":
-                pos_score = 0
-                if piece[1] != "K":
-                    if piece[1] == "p":
-                        pos_score = piecePosScores[piece][r][c]
-                    else:
-                        pos_score = piecePosScores[piece[1]][r][c]
-                if piece[0] == 'w':
-                    score += pieceScore[piece[1]] + pos_score
-                elif piece[0] == 'b':
-                    score -= pieceScore[piece[1]] + pos_score
-    return score
+    known_score = tablebase_score(gs, tables)
+    if known_score is not None:
+        return known_score
+    # Material and piece-square totals are kept up to date by make_move/undo_move
+    return gs.material['w'] - gs.material['b'] + gs.positional['w'] - gs.positional['b']
+
+
+class CancellationToken:
+    """Stop flag for a running search, cancel() may be called from any thread."""
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until cancelled or timeout seconds have passed, return cancelled."""
+        return self._event.wait(timeout)
+
+
+@dataclass
+class SearchResult:
+    move: Optional[Move]  # best move of the last completed iteration
+    stats: SearchStats = field(default_factory=SearchStats)
+    cancelled: bool = False  # stopped by the cancellation token, move may come from a shallower depth
+
+
+class Searcher:
+    """
+    Alpha-beta search with all of its state (transposition table, move ordering
+    tables, counters and limits) in the instance, so separate Searchers can run
+    side by side in threads. One Searcher runs one search at a time; keep it
+    between the moves of a game so its tables carry over.
+    workers > 1 searches the root moves in a pool of that many processes, which
+    load the tablebases from tablebases.directory (tables built in memory are not shared).
+    """
+    def __init__(self, opening_book: Optional[OpeningBook] = None, tablebases: Optional[Tablebases] = None,
+                 tt_size_log2: int = 18, workers: int = None):
+        self.opening_book = opening_book
+        self.tablebases = tablebases
+        self.workers = workers
+        self.transposition_table = TranspositionTable(tt_size_log2)
+        self.killer_moves = [[None, None] for _ in range(MAX_ITERATIVE_DEPTH + 1)]
+        # Indexed [white_to_move][start_square * 64 + end_square]
+        self.history_table = [[0] * 4096, [0] * 4096]
+        self.parallel_searcher = None  # process pool kept between moves
+        self.next_move = None
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.expanded_nodes = 0  # main search nodes whose moves were searched
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.root_depth = MAX_DEPTH
+        self.deadline = None
+        self.node_limit = None
+        self.cancel = None
+        self.search_stopped = False
+        self.random_tie_break = False
+
+    def close(self) -> None:
+        """Shut down the worker processes, if any."""
+        if self.parallel_searcher is not None:
+            self.parallel_searcher.shutdown()
+            self.parallel_searcher = None
+
+    def search(self, gs: GameState, valid_moves: list = None, time_limit: float = None,
+               max_nodes: int = None, max_depth: int = None, randomize: bool = False,
+               cancel: CancellationToken = None, on_iteration=None, on_search=None) -> SearchResult:
+        """
+        Search like find_best_move_minimax. The search stops early, keeping the
+        best move of the last completed depth, once cancel is cancelled.
+        on_iteration and on_search are called with the SearchStats as in search_best_move.
+        """
+        if valid_moves is None:
+            valid_moves = gs.get_valid_moves()
+        result = self._search(gs, valid_moves, time_limit, max_nodes, max_depth, randomize, cancel, on_iteration)
+        if on_search is not None:
+            on_search(result.stats)
+        return result
+
+    def _search(self, gs, valid_moves, time_limit, max_nodes, max_depth, randomize, cancel, on_iteration):
+        if self.opening_book is not None:
+            book_move = self.opening_book.find_move(gs, valid_moves, randomize)
+            if book_move is not None:
+                return SearchResult(book_move, SearchStats(source="book",
+                                                           principal_variation=[book_move.get_chess_notation()]))
+        if self.tablebases is not None:
+            tablebase_move = self.tablebases.best_move(gs, valid_moves)
+            if tablebase_move is not None:
+                return SearchResult(tablebase_move, SearchStats(
+                    source="tablebase", score=tablebase_score(gs, self.tablebases),
+                    principal_variation=[tablebase_move.get_chess_notation()]))
+        if self.workers is not None and self.workers > 1:
+            move, stats = self._get_parallel_searcher().search(gs, valid_moves, time_limit, max_depth,
+                                                                on_iteration, cancel)
+            return SearchResult(move, stats, cancel is not None and cancel.cancelled)
+        if max_depth is None:
+            max_depth = MAX_DEPTH if time_limit is None and max_nodes is None else MAX_ITERATIVE_DEPTH
+        self.nodes = self.quiescence_nodes = self.expanded_nodes = self.cutoffs = self.first_move_cutoffs = 0
+        start_time = time.time()
+        self.deadline = start_time + time_limit if time_limit is not None else None
+        self.node_limit = max_nodes
+        self.cancel = cancel
+        self.search_stopped = False
+        self.random_tie_break = randomize
+        self.new_search()
+        stats = SearchStats()
+        best_move = None
+        for depth in range(1, max_depth + 1):
+            # The recursion only checks the budget every BUDGET_CHECK_MASK + 1 nodes,
+            # which cheap iterations (table hits, short mates) may never reach
+            if depth > 1 and self._budget_exhausted():
+                break
+            self.next_move = None
+            self.root_depth = depth
+            iteration_start = self.nodes
+            # The transposition table hands each iteration the previous principal
+            # variation, so it is searched first at every node on the next pass
+            score = self.find_move_minimax(gs, valid_moves, depth, -check_mate, check_mate, gs.white_to_move)
+            stats.depth_nodes[depth] = self.nodes - iteration_start
+            if self.search_stopped:
+                break
+            best_move = self.next_move
+            stats.depth, stats.score = depth, score
+            if on_iteration is not None:
+                self._update_stats(stats, gs, best_move, start_time)
+                on_iteration(stats)
+            if abs(score) >= check_mate:  # a proven mate, deeper iterations cannot change it
+                break
+        if best_move is None:  # not even depth 1 finished, fall back to the partial result
+            best_move = self.next_move
+        self.deadline = self.node_limit = self.cancel = None
+        self._update_stats(stats, gs, best_move, start_time)
+        return SearchResult(best_move, stats, cancel is not None and cancel.cancelled)
+
+    def search_move(self, gs: GameState, move: Move, depth: int, alpha: int, beta: int,
+                    deadline: float = None, cancel=None) -> Tuple[int, bool]:
+        """
+        Score of move searched to depth with the (alpha, beta) window, and whether
+        the search finished before the deadline or cancel. Used by parallel_search
+        for single root moves; the node counter keeps running between calls.
+        """
+        self.root_depth = depth
+        self.deadline = deadline
+        self.node_limit = None
+        self.cancel = cancel
+        self.search_stopped = False
+        self.random_tie_break = False
+        gs.make_move(move)
+        score = self.find_move_minimax(gs, gs.get_valid_moves(), depth - 1, alpha, beta, gs.white_to_move)
+        gs.undo_move()
+        return score, not self.search_stopped
+
+    def new_search(self) -> None:
+        """Age the transposition table and move ordering tables before searching a new position."""
+        self.transposition_table.new_search()
+        for killers in self.killer_moves:
+            killers[0] = killers[1] = None
+        # Keep some history from the previous move, it is mostly still relevant
+        for table in self.history_table:
+            for i in range(4096):
+                table[i] >>= 2
+
+    def _get_parallel_searcher(self):
+        from parallel_search import ParallelSearch  # imports this module
+        tablebase_dir = self.tablebases.directory if self.tablebases is not None else None
+        if (self.parallel_searcher is None or self.parallel_searcher.workers != self.workers
+                or self.parallel_searcher.tablebase_dir != tablebase_dir):
+            self.close()
+            self.parallel_searcher = ParallelSearch(self.workers, tablebase_dir)
+        return self.parallel_searcher
+
+    def _update_stats(self, stats: SearchStats, gs: GameState, best_move: Move, start_time: float) -> None:
+        stats.nodes = self.nodes
+        stats.quiescence_nodes = self.quiescence_nodes
+        stats.expanded_nodes = self.expanded_nodes
+        stats.cutoffs = self.cutoffs
+        stats.first_move_cutoffs = self.first_move_cutoffs
+        stats.tt_probes = self.transposition_table.probes
+        stats.tt_hits = self.transposition_table.hits
+        stats.elapsed = time.time() - start_time
+        stats.principal_variation = [move.get_chess_notation()
+                                     for move in self.principal_variation(gs, best_move, max(stats.depth, 1))]
+
+    def principal_variation(self, gs: GameState, first_move: Move, max_length: int) -> List[Move]:
+        """
+        The line the search expects from gs: first_move, then the transposition
+        table move of every position reached, up to max_length moves.
+        """
+        if first_move is None:
+            return []
+        line = [first_move]
+        gs.make_move(first_move)
+        seen = {gs.zobrist_key}
+        while len(line) < max_length:
+            entry = self.transposition_table.get(gs.zobrist_key)
+            if entry is None or entry[MOVE_ID] is None:
+                break
+            move = next((m for m in gs.get_valid_moves() if m.move_id == entry[MOVE_ID]), None)
+            if move is None:  # key collision
+                break
+            gs.make_move(move)
+            line.append(move)
+            if gs.zobrist_key in seen:  # the line repeats from here
+                break
+            seen.add(gs.zobrist_key)
+        for _ in line:
+            gs.undo_move()
+        return line
+
+    def order_moves(self, valid_moves: list, tt_move_id, ply: int, white_to_move: bool) -> None:
+        """
+        Sort moves in place: transposition table move, captures by MVV-LVA,
+        killer moves of this ply, then quiet moves by history score.
+        """
+        killers = self.killer_moves[ply]
+        history = self.history_table[white_to_move]
+
+        def order(move: Move) -> int:
+            if move.move_id == tt_move_id:
+                return TT_MOVE_ORDER
+            if move.is_capture or move.is_pawn_promotion:
+                return CAPTURE_ORDER + mvv_lva(move)
+            if move.move_id == killers[0]:
+                return KILLER_ORDER[0]
+            if move.move_id == killers[1]:
+                return KILLER_ORDER[1]
+            return history[move.start_sq * 64 + move.end_sq]
+
+        if self.random_tie_break:
+            random.shuffle(valid_moves)
+        valid_moves.sort(key=order, reverse=True)
+
+    def _record_cutoff(self, move: Move, ply: int, depth: int, white_to_move: bool) -> None:
+        """Remember a quiet move that caused a beta cutoff as a killer and in the history table."""
+        if move.is_capture or move.is_pawn_promotion:
+            return
+        killers = self.killer_moves[ply]
+        if killers[0] != move.move_id:
+            killers[1] = killers[0]
+            killers[0] = move.move_id
+        history = self.history_table[white_to_move]
+        index = move.start_sq * 64 + move.end_sq
+        history[index] = min(history[index] + depth * depth, HISTORY_MAX)
+
+    def _budget_exhausted(self) -> bool:
+        if ((self.node_limit is not None and self.nodes >= self.node_limit)
+                or (self.deadline is not None and time.time() >= self.deadline)
+                or (self.cancel is not None and self.cancel.cancelled)):
+            self.search_stopped = True
+        return self.search_stopped
+
+    def find_move_minimax(self, gs: GameState, valid_moves: list, depth: int, alpha: int, beta: int,
+                          white_to_move: bool) -> int:
+        self.nodes += 1
+        if self.nodes & BUDGET_CHECK_MASK == 0 and self._budget_exhausted():
+            return 0
+        if gs.check_mate or gs.stale_mate:
+            return score_board(gs)
+        if depth != self.root_depth and self.tablebases is not None:
+            known_score = tablebase_score(gs, self.tablebases)
+            if known_score is not None:
+                return known_score
+        if depth == 0:
+            return self.quiescence_search(gs, alpha, beta, white_to_move)
+        key = gs.zobrist_key
+        entry = self.transposition_table.probe(key)
+        tt_move_id = None
+        if entry is not None:
+            tt_move_id = entry[MOVE_ID]
+            # The root always searches so that next_move gets set
+            if entry[DEPTH] >= depth and depth != self.root_depth:
+                if entry[BOUND] == EXACT:
+                    return entry[SCORE]
+                elif entry[BOUND] == LOWER_BOUND:
+                    alpha = max(alpha, entry[SCORE])
+                else:
+                    beta = min(beta, entry[SCORE])
+                if beta <= alpha:
+                    return entry[SCORE]
+        alpha_orig, beta_orig = alpha, beta
+        ply = self.root_depth - depth
+        self.expanded_nodes += 1
+        self.order_moves(valid_moves, tt_move_id, ply, white_to_move)
+        best_move_id = None
+        if white_to_move:
+            max_score = -check_mate
+            for move in valid_moves:
+                gs.make_move(move)
+                score = self.find_move_minimax(gs, gs.get_valid_moves(), depth - 1, alpha, beta, False)
+                gs.undo_move()
+                if self.search_stopped:
+                    return 0
+                if score > max_score or best_move_id is None:
+                    max_score = score
+                    best_move_id = move.move_id
+                    if depth == self.root_depth:
+                        self.next_move = move
+                alpha = max(alpha, score)
+                if beta <= alpha:
+                    self.cutoffs += 1
+                    if move is valid_moves[0]:
+                        self.first_move_cutoffs += 1
+                    self._record_cutoff(move, ply, depth, white_to_move)
+                    break
+            best_score = max_score
+        else:
+            min_score = check_mate
+            for move in valid_moves:
+                gs.make_move(move)
+                score = self.find_move_minimax(gs, gs.get_valid_moves(), depth - 1, alpha, beta, True)
+                gs.undo_move()
+                if self.search_stopped:
+                    return 0
+                if score < min_score or best_move_id is None:
+                    min_score = score
+                    best_move_id = move.move_id
+                    if depth == self.root_depth:
+                        self.next_move = move
+                beta = min(beta, score)
+                if beta <= alpha:
+                    self.cutoffs += 1
+                    if move is valid_moves[0]:
+                        self.first_move_cutoffs += 1
+                    self._record_cutoff(move, ply, depth, white_to_move)
+                    break
+            best_score = min_score
+        if best_score <= alpha_orig:
+            bound = UPPER_BOUND
+        elif best_score >= beta_orig:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.transposition_table.store(key, depth, bound, best_score, best_move_id)
+        return best_score
+
+    def quiescence_search(self, gs: GameState, alpha: int, beta: int, white_to_move: bool) -> int:
+        """
+        Resolve captures at the leaves so positions are only evaluated when quiet.
+        The side to move may stand pat on the static score instead of capturing.
+        """
+        self.nodes += 1
+        self.quiescence_nodes += 1
+        if self.nodes & BUDGET_CHECK_MASK == 0 and self._budget_exhausted():
+            return 0
+        if self.tablebases is not None:
+            known_score = tablebase_score(gs, self.tablebases)
+            if known_score is not None:
+                return known_score
+        moves = gs.get_capture_moves()  # also refreshes gs.in_check
+        if gs.in_check and QUIESCENCE_CHECK_EVASIONS:
+            moves = gs.get_valid_moves()
+            if not moves:
+                return score_board(gs)
+            stand_pat = None
+            moves.sort(key=lambda m: mvv_lva(m) if m.is_capture else -check_mate, reverse=True)
+        else:
+            stand_pat = score_board(gs)  # the tablebases were probed above
+            if white_to_move:
+                if stand_pat >= beta:
+                    return stand_pat
+                alpha = max(alpha, stand_pat)
+            else:
+                if stand_pat <= alpha:
+                    return stand_pat
+                beta = min(beta, stand_pat)
+            moves.sort(key=mvv_lva, reverse=True)
+
+        best_score = stand_pat if stand_pat is not None else (-check_mate if white_to_move else check_mate)
+        for move in moves:
+            # Delta pruning: even winning this material cannot bring the score back into the window
+            if stand_pat is not None:
+                gain = material_gain(move) + DELTA_MARGIN
+                if (stand_pat + gain <= alpha) if white_to_move else (stand_pat - gain >= beta):
+                    continue
+            gs.make_move(move)
+            score = self.quiescence_search(gs, alpha, beta, not white_to_move)
+            gs.undo_move()
+            if self.search_stopped:
+                return 0
+            if white_to_move:
+                if score > best_score:
+                    best_score = score
+                alpha = max(alpha, score)
+            else:
+                if score < best_score:
+                    best_score = score
+                beta = min(beta, score)
+            if beta <= alpha:
+                break
+        return best_score
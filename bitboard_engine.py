@@ -0,0 +1,444 @@
+from typing import Dict, List
+from chess_engine import CastleRights, Move, parse_fen
+from utils import diagonalDirections, kingDirections, knightDirections, straightDirections
+import zobrist
+import evaluation
+
+# Squares are indexed row * 8 + col, so bit 0 is a8 and bit 63 is h1 (same orientation as GameState.board)
+FULL_BOARD = (1 << 64) - 1
+SQUARE_TO_ROW_COL = tuple(divmod(sq, 8) for sq in range(64))
+
+# Castling rights packed into a bitmask
+WHITE_KING_SIDE = 1
+WHITE_QUEEN_SIDE = 2
+BLACK_KING_SIDE = 4
+BLACK_QUEEN_SIDE = 8
+ALL_CASTLE_RIGHTS = 15
+
+
+def _on_board(r: int, c: int) -> bool:
+    return 0 <= r < 8 and 0 <= c < 8
+
+
+def _step_table(directions) -> List[int]:
+    """Attack table for pieces that move one step in each of the given directions."""
+    table = []
+    for sq in range(64):
+        r, c = SQUARE_TO_ROW_COL[sq]
+        attacks = 0
+        for dr, dc in directions:
+            if _on_board(r + dr, c + dc):
+                attacks |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(attacks)
+    return table
+
+
+def _ray_table(direction) -> List[int]:
+    """For every square, all squares reachable along the direction on an empty board."""
+    dr, dc = direction
+    table = []
+    for sq in range(64):
+        r, c = SQUARE_TO_ROW_COL[sq]
+        ray = 0
+        r, c = r + dr, c + dc
+        while _on_board(r, c):
+            ray |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(ray)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table(knightDirections)
+KING_ATTACKS = _step_table(kingDirections)
+PAWN_ATTACKS = {
+    'w': _step_table(((-1, -1), (-1, 1))),
+    'b': _step_table(((1, -1), (1, 1))),
+}
+
+# Rays are split by whether they run towards higher square indices, which decides
+# whether the nearest blocker is the lowest or the highest set bit.
+STRAIGHT_RAYS = [(d[0] * 8 + d[1] > 0, _ray_table(d)) for d in straightDirections]
+DIAGONAL_RAYS = [(d[0] * 8 + d[1] > 0, _ray_table(d)) for d in diagonalDirections]
+ROOK_EMPTY_ATTACKS = [0] * 64
+BISHOP_EMPTY_ATTACKS = [0] * 64
+for _sq in range(64):
+    for _, _rays in STRAIGHT_RAYS:
+        ROOK_EMPTY_ATTACKS[_sq] |= _rays[_sq]
+    for _, _rays in DIAGONAL_RAYS:
+        BISHOP_EMPTY_ATTACKS[_sq] |= _rays[_sq]
+
+# BETWEEN[a][b] holds the squares strictly between two aligned squares, 0 otherwise
+BETWEEN = [[0] * 64 for _ in range(64)]
+for _sq in range(64):
+    for _, _rays in STRAIGHT_RAYS + DIAGONAL_RAYS:
+        _ray = _rays[_sq]
+        _bits = _ray
+        while _bits:
+            _lsb = _bits & -_bits
+            _target = _lsb.bit_length() - 1
+            BETWEEN[_sq][_target] = _ray & ~_rays[_target] & ~_lsb
+            _bits ^= _lsb
+
+# Castling rights that survive a move touching a square (king and rook home squares)
+CASTLE_RIGHTS_MASK = [ALL_CASTLE_RIGHTS] * 64
+CASTLE_RIGHTS_MASK[60] = ALL_CASTLE_RIGHTS & ~(WHITE_KING_SIDE | WHITE_QUEEN_SIDE)
+CASTLE_RIGHTS_MASK[63] = ALL_CASTLE_RIGHTS & ~WHITE_KING_SIDE
+CASTLE_RIGHTS_MASK[56] = ALL_CASTLE_RIGHTS & ~WHITE_QUEEN_SIDE
+CASTLE_RIGHTS_MASK[4] = ALL_CASTLE_RIGHTS & ~(BLACK_KING_SIDE | BLACK_QUEEN_SIDE)
+CASTLE_RIGHTS_MASK[7] = ALL_CASTLE_RIGHTS & ~BLACK_KING_SIDE
+CASTLE_RIGHTS_MASK[0] = ALL_CASTLE_RIGHTS & ~BLACK_QUEEN_SIDE
+
+
+def _slider_attacks(sq: int, occupied: int, rays) -> int:
+    attacks = 0
+    for positive, table in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return _slider_attacks(sq, occupied, STRAIGHT_RAYS)
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return _slider_attacks(sq, occupied, DIAGONAL_RAYS)
+
+
+class BitboardGameState:
+    """
+    Drop-in alternative to chess_engine.GameState that keeps one 64-bit bitboard per
+    piece type and color and generates legal moves from precomputed attack tables.
+    A mailbox copy of the position is kept in `board` so Move objects and the GUI
+    keep working unchanged.
+    """
+    def __init__(self):
+        self.board = [
+            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+            ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
+            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
+        ]
+        self.white_to_move = True
+        self.moves_log: List[Move] = []
+        self.in_check = False
+        self.check_mate = False
+        self.stale_mate = False
+        self.castle_rights = ALL_CASTLE_RIGHTS
+        self.enpassant_square = -1
+        # (castle_rights, enpassant_square, zobrist_key) before each move, popped by undo_move
+        self.state_log = []
+        self._load_bitboards()
+        self.zobrist_key = zobrist.hash_position(self.board, self.white_to_move, self.castle_rights)
+        self.material, self.positional = evaluation.material_and_position(self.board)
+
+    def load_fen(self, fen: str) -> None:
+        """Set up the position described by a FEN string, clearing the move history."""
+        self.board, self.white_to_move, rights, enpassant = parse_fen(fen)
+        self.castle_rights = ((WHITE_KING_SIDE if rights.wks else 0) | (WHITE_QUEEN_SIDE if rights.wqs else 0)
+                              | (BLACK_KING_SIDE if rights.bks else 0) | (BLACK_QUEEN_SIDE if rights.bqs else 0))
+        self.enpassant_square = enpassant[0] * 8 + enpassant[1] if enpassant else -1
+        self.moves_log = []
+        self.state_log = []
+        self.in_check = self.check_mate = self.stale_mate = False
+        self._load_bitboards()
+        self.zobrist_key = zobrist.hash_position(self.board, self.white_to_move, self.castle_rights,
+                                                 enpassant[1] if enpassant else -1)
+        self.material, self.positional = evaluation.material_and_position(self.board)
+
+    def _load_bitboards(self) -> None:
+        """Rebuild all bitboards from the mailbox board."""
+        self.pieces: Dict[str, int] = {color + kind: 0 for color in "wb" for kind in "pNBRQK"}
+        self.occupancy = {'w': 0, 'b': 0}
+        for sq in range(64):
+            r, c = SQUARE_TO_ROW_COL[sq]
+            piece = self.board[r][c]
+            if piece != "--":
+                self.pieces[piece] |= 1 << sq
+                self.occupancy[piece[0]] |= 1 << sq
+
+    @property
+    def white_king_loc(self):
+        return SQUARE_TO_ROW_COL[self.pieces["wK"].bit_length() - 1]
+
+    @property
+    def black_king_loc(self):
+        return SQUARE_TO_ROW_COL[self.pieces["bK"].bit_length() - 1]
+
+    @property
+    def enpassant_possible(self):
+        return SQUARE_TO_ROW_COL[self.enpassant_square] if self.enpassant_square >= 0 else ()
+
+    @property
+    def current_castling_right(self) -> CastleRights:
+        rights = self.castle_rights
+        return CastleRights(bool(rights & WHITE_KING_SIDE), bool(rights & WHITE_QUEEN_SIDE),
+                            bool(rights & BLACK_KING_SIDE), bool(rights & BLACK_QUEEN_SIDE))
+
+    def make_move(self, move: Move) -> None:
+        """Make the given move on the board."""
+        pieces = self.pieces
+        piece = move.piece_move
+        color = piece[0]
+        enemy = 'b' if color == 'w' else 'w'
+        start = move.start_sq
+        end = move.end_sq
+        start_bit = 1 << start
+        end_bit = 1 << end
+        self.state_log.append((self.castle_rights, self.enpassant_square, self.zobrist_key))
+        piece_keys = zobrist.PIECE_KEYS
+        key = self.zobrist_key ^ zobrist.SIDE_KEY ^ piece_keys[piece][start] ^ piece_keys[piece][end]
+
+        if move.piece_captured != "--":
+            captured_sq = move.start_row * 8 + move.end_col if move.is_enpassant_move else end
+            key ^= piece_keys[move.piece_captured][captured_sq]
+            pieces[move.piece_captured] ^= 1 << captured_sq
+            self.occupancy[enemy] ^= 1 << captured_sq
+            if move.is_enpassant_move:
+                self.board[move.start_row][move.end_col] = "--"
+        self.board[move.start_row][move.start_col] = "--"
+        self.board[move.end_row][move.end_col] = piece
+        pieces[piece] ^= start_bit | end_bit
+        self.occupancy[color] ^= start_bit | end_bit
+
+        if move.is_pawn_promotion:
+            pieces[piece] ^= end_bit
+            pieces[color + 'Q'] |= end_bit
+            self.board[move.end_row][move.end_col] = color + 'Q'
+            key ^= piece_keys[piece][end] ^ piece_keys[color + 'Q'][end]
+        elif move.is_castle_move:
+            if move.end_col - move.start_col == 2:  # kingside
+                rook_from, rook_to = end + 1, end - 1
+            else:  # queenside
+                rook_from, rook_to = end - 2, end + 1
+            rook_bits = (1 << rook_from) | (1 << rook_to)
+            pieces[color + 'R'] ^= rook_bits
+            self.occupancy[color] ^= rook_bits
+            self.board[move.end_row][rook_to % 8] = color + 'R'
+            self.board[move.end_row][rook_from % 8] = "--"
+            key ^= piece_keys[color + 'R'][rook_from] ^ piece_keys[color + 'R'][rook_to]
+
+        if self.enpassant_square >= 0:
+            key ^= zobrist.ENPASSANT_KEYS[self.enpassant_square % 8]
+        if piece[1] == 'p' and abs(start - end) == 16:
+            self.enpassant_square = (start + end) // 2
+            key ^= zobrist.ENPASSANT_KEYS[self.enpassant_square % 8]
+        else:
+            self.enpassant_square = -1
+        key ^= zobrist.CASTLE_KEYS[self.castle_rights]
+        self.castle_rights &= CASTLE_RIGHTS_MASK[start] & CASTLE_RIGHTS_MASK[end]
+        self.zobrist_key = key ^ zobrist.CASTLE_KEYS[self.castle_rights]
+        evaluation.apply_move_scores(self.material, self.positional, move, 1)
+        self.moves_log.append(move)
+        self.white_to_move = not self.white_to_move
+
+    def undo_move(self) -> None:
+        """Undo the last move."""
+        if not self.moves_log:
+            return
+        move = self.moves_log.pop()
+        self.castle_rights, self.enpassant_square, self.zobrist_key = self.state_log.pop()
+        evaluation.apply_move_scores(self.material, self.positional, move, -1)
+        self.white_to_move = not self.white_to_move
+        pieces = self.pieces
+        piece = move.piece_move
+        color = piece[0]
+        enemy = 'b' if color == 'w' else 'w'
+        start = move.start_sq
+        end = move.end_sq
+        start_bit = 1 << start
+        end_bit = 1 << end
+
+        if move.is_pawn_promotion:
+            pieces[color + 'Q'] ^= end_bit
+            pieces[piece] |= end_bit
+        elif move.is_castle_move:
+            if move.end_col - move.start_col == 2:
+                rook_from, rook_to = end + 1, end - 1
+            else:
+                rook_from, rook_to = end - 2, end + 1
+            rook_bits = (1 << rook_from) | (1 << rook_to)
+            pieces[color + 'R'] ^= rook_bits
+            self.occupancy[color] ^= rook_bits
+            self.board[move.end_row][rook_from % 8] = color + 'R'
+            self.board[move.end_row][rook_to % 8] = "--"
+        pieces[piece] ^= start_bit | end_bit
+        self.occupancy[color] ^= start_bit | end_bit
+        self.board[move.start_row][move.start_col] = piece
+        self.board[move.end_row][move.end_col] = "--"
+
+        if move.piece_captured != "--":
+            if move.is_enpassant_move:
+                captured_sq = move.start_row * 8 + move.end_col
+                self.board[move.start_row][move.end_col] = move.piece_captured
+            else:
+                captured_sq = end
+                self.board[move.end_row][move.end_col] = move.piece_captured
+            pieces[move.piece_captured] |= 1 << captured_sq
+            self.occupancy[enemy] |= 1 << captured_sq
+        self.check_mate = False
+        self.stale_mate = False
+
+    def attackers_to(self, sq: int, color: str, occupied: int) -> int:
+        """Bitboard of pieces of `color` attacking `sq` given the occupancy."""
+        pieces = self.pieces
+        other = 'b' if color == 'w' else 'w'
+        return ((KNIGHT_ATTACKS[sq] & pieces[color + 'N'])
+                | (KING_ATTACKS[sq] & pieces[color + 'K'])
+                | (PAWN_ATTACKS[other][sq] & pieces[color + 'p'])
+                | (rook_attacks(sq, occupied) & (pieces[color + 'R'] | pieces[color + 'Q']))
+                | (bishop_attacks(sq, occupied) & (pieces[color + 'B'] | pieces[color + 'Q'])))
+
+    def is_square_attacked(self, row: int, col: int, by_color: str) -> bool:
+        """Whether any piece of by_color attacks the square, same interface as GameState."""
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        return bool(self.attackers_to(row * 8 + col, by_color, occupied))
+
+    def get_valid_moves(self) -> List[Move]:
+        """Return all legal moves for the current game state."""
+        moves = self._generate_moves(False)
+        self.check_mate = not moves and self.in_check
+        self.stale_mate = not moves and not self.in_check
+        return moves
+
+    def get_capture_moves(self) -> List[Move]:
+        """Return the legal captures and promotions (quiescence search moves)."""
+        return self._generate_moves(True)
+
+    def _generate_moves(self, captures_only: bool) -> List[Move]:
+        moves = []
+        lookup = Move.lookup
+        board = self.board
+        pieces = self.pieces
+        ally, enemy = ('w', 'b') if self.white_to_move else ('b', 'w')
+        own = self.occupancy[ally]
+        occupied = own | self.occupancy[enemy]
+        king_sq = pieces[ally + 'K'].bit_length() - 1
+        checkers = self.attackers_to(king_sq, enemy, occupied)
+        self.in_check = bool(checkers)
+        capture_mask = self.occupancy[enemy] if captures_only else FULL_BOARD
+
+        # King moves: test each target with the king lifted off the board so it
+        # cannot hide behind itself on a slider's ray
+        without_king = occupied ^ (1 << king_sq)
+        targets = KING_ATTACKS[king_sq] & ~own & capture_mask
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            to = lsb.bit_length() - 1
+            if not self.attackers_to(to, enemy, without_king):
+                moves.append(lookup(king_sq, to, ally + 'K', board[to >> 3][to & 7]))
+
+        if checkers & (checkers - 1):  # double check, only the king may move
+            return moves
+
+        if checkers:
+            checker_sq = checkers.bit_length() - 1
+            allowed = BETWEEN[king_sq][checker_sq] | checkers
+        else:
+            allowed = FULL_BOARD ^ own
+            if not captures_only:
+                self._get_castle_moves(king_sq, occupied, enemy, moves)
+
+        # Pinned pieces may only move along the line between the king and the pinner
+        pin_masks = {}
+        rook_sliders = pieces[enemy + 'R'] | pieces[enemy + 'Q']
+        bishop_sliders = pieces[enemy + 'B'] | pieces[enemy + 'Q']
+        snipers = (ROOK_EMPTY_ATTACKS[king_sq] & rook_sliders) | (BISHOP_EMPTY_ATTACKS[king_sq] & bishop_sliders)
+        while snipers:
+            lsb = snipers & -snipers
+            snipers ^= lsb
+            sniper_sq = lsb.bit_length() - 1
+            blockers = BETWEEN[king_sq][sniper_sq] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pin_masks[blockers.bit_length() - 1] = BETWEEN[king_sq][sniper_sq] | lsb
+
+        self._get_pawn_moves(ally, enemy, king_sq, occupied, allowed, pin_masks, captures_only, moves)
+        for kind in "NBRQ":
+            piece = ally + kind
+            bits = pieces[piece]
+            while bits:
+                lsb = bits & -bits
+                bits ^= lsb
+                sq = lsb.bit_length() - 1
+                if kind == 'N':
+                    if sq in pin_masks:
+                        continue
+                    targets = KNIGHT_ATTACKS[sq]
+                elif kind == 'B':
+                    targets = bishop_attacks(sq, occupied)
+                elif kind == 'R':
+                    targets = rook_attacks(sq, occupied)
+                else:
+                    targets = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+                targets &= allowed & capture_mask
+                if sq in pin_masks:
+                    targets &= pin_masks[sq]
+                while targets:
+                    to_bit = targets & -targets
+                    targets ^= to_bit
+                    to = to_bit.bit_length() - 1
+                    moves.append(lookup(sq, to, piece, board[to >> 3][to & 7]))
+        return moves
+
+    def _get_pawn_moves(self, ally: str, enemy: str, king_sq: int, occupied: int, allowed: int,
+                        pin_masks: dict, captures_only: bool, moves: List[Move]) -> None:
+        board = self.board
+        lookup = Move.lookup
+        pawn = ally + 'p'
+        forward, start_row = (-8, 6) if ally == 'w' else (8, 1)
+        promotion_row = 0 if ally == 'w' else 7
+        enemy_occupancy = self.occupancy[enemy]
+        attack_table = PAWN_ATTACKS[ally]
+        ep_bit = 1 << self.enpassant_square if self.enpassant_square >= 0 else 0
+        bits = self.pieces[ally + 'p']
+        while bits:
+            lsb = bits & -bits
+            bits ^= lsb
+            sq = lsb.bit_length() - 1
+            legal = allowed & pin_masks[sq] if sq in pin_masks else allowed
+            one_step = sq + forward
+            if not occupied & (1 << one_step):
+                if legal & (1 << one_step) and (not captures_only or one_step >> 3 == promotion_row):
+                    moves.append(lookup(sq, one_step, pawn, "--"))
+                two_step = one_step + forward
+                if (not captures_only and sq >> 3 == start_row and not occupied & (1 << two_step)
+                        and legal & (1 << two_step)):
+                    moves.append(lookup(sq, two_step, pawn, "--"))
+            captures = attack_table[sq] & enemy_occupancy & legal
+            while captures:
+                to_bit = captures & -captures
+                captures ^= to_bit
+                to = to_bit.bit_length() - 1
+                moves.append(lookup(sq, to, pawn, board[to >> 3][to & 7]))
+            if attack_table[sq] & ep_bit:
+                # Replay the capture on the occupancy and look for any remaining attacker,
+                # which covers pins along the rank that two pawns vacate at once
+                captured_sq = self.enpassant_square - forward
+                after = (occupied ^ lsb ^ (1 << captured_sq)) | ep_bit
+                if not self.attackers_to(king_sq, enemy, after) & ~(1 << captured_sq):
+                    moves.append(lookup(sq, self.enpassant_square, pawn, "--", is_enpassant_move=True))
+
+    def _get_castle_moves(self, king_sq: int, occupied: int, enemy: str, moves: List[Move]) -> None:
+        if self.white_to_move:
+            king, king_side, queen_side = "wK", WHITE_KING_SIDE, WHITE_QUEEN_SIDE
+        else:
+            king, king_side, queen_side = "bK", BLACK_KING_SIDE, BLACK_QUEEN_SIDE
+        if (self.castle_rights & king_side
+                and not occupied & (0b11 << (king_sq + 1))
+                and not self.attackers_to(king_sq + 1, enemy, occupied)
+                and not self.attackers_to(king_sq + 2, enemy, occupied)):
+            moves.append(Move.lookup(king_sq, king_sq + 2, king, "--", is_castle_move=True))
+        if (self.castle_rights & queen_side
+                and not occupied & (0b111 << (king_sq - 3))
+                and not self.attackers_to(king_sq - 1, enemy, occupied)
+                and not self.attackers_to(king_sq - 2, enemy, occupied)):
+            moves.append(Move.lookup(king_sq, king_sq - 2, king, "--", is_castle_move=True))
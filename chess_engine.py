@@ -1,46 +1,86 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 import copy
+import numpy as np
 from typing import Tuple, List
-from utils import diagonalDirections, kingDirections, knightDirections, straightDirections
+from utils import diagonalDirections, straightDirections, rayDirections, knightSquares, kingSquares, \
+    pawnAttackSquares, raySquares
+import zobrist
+import evaluation
+
+# Square names and piece codes used to look up moves, squares are indexed row * 8 + col
+SQUARE_NAMES = tuple(file + rank for rank in "87654321" for file in "abcdefgh")
+PIECE_CODES = {piece: i for i, piece in enumerate(
+    ["--", "wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"])}
 
-@dataclass(eq=False)
 class Move:
-    start_square: Tuple[int, int]
-    end_square: Tuple[int, int]
-    board: List[List[str]]
-    is_enpassant_move: bool = False
-    is_castle_move: bool = False
-    piece_move: str = field(init=False)
-    piece_captured: str = field(init=False)
-    is_pawn_promotion: bool = field(init=False)
-    is_capture: bool = field(init=False)
-    move_id: int = field(init=False)
-    
+    """
+    A move between two squares and the pieces involved. Moves hold no reference to the
+    board and are never modified, so the move generators share one instance per distinct
+    move through Move.lookup instead of allocating new ones at every node.
+    """
+    __slots__ = ("start_sq", "end_sq", "start_row", "start_col", "end_row", "end_col",
+                 "piece_move", "piece_captured", "is_enpassant_move", "is_castle_move",
+                 "is_pawn_promotion", "is_capture", "move_id")
+
     # Static mappings for board coordinates
     rank_to_row = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     row_to_rank = {v: k for k, v in rank_to_row.items()}
     file_to_col = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     col_to_file = {v: k for k, v in file_to_col.items()}
-    
-    def __post_init__(self):
-        self.start_row, self.start_col = self.start_square
-        self.end_row, self.end_col = self.end_square
-        self.piece_move = self.board[self.start_row][self.start_col]
-        self.piece_captured = self.board[self.end_row][self.end_col]
-        self.is_pawn_promotion = ((self.piece_move == "wp" and self.end_row == 0) or 
-                                  (self.piece_move == "bp" and self.end_row == 7))
-        if self.is_enpassant_move:
-            self.piece_captured = "wp" if self.piece_move == "bp" else "bp"
-        self.is_capture = (self.piece_captured != "--")
+
+    # Shared instances keyed by squares, pieces and flags, filled by lookup
+    _table = {}
+
+    def __init__(self, start_square: Tuple[int, int], end_square: Tuple[int, int], board: List[List[str]],
+                 is_enpassant_move: bool = False, is_castle_move: bool = False):
+        start_row, start_col = start_square
+        end_row, end_col = end_square
+        self._set(start_row * 8 + start_col, end_row * 8 + end_col, board[start_row][start_col],
+                  board[end_row][end_col], is_enpassant_move, is_castle_move)
+
+    @classmethod
+    def lookup(cls, start_sq: int, end_sq: int, piece_move: str, piece_captured: str,
+               is_enpassant_move: bool = False, is_castle_move: bool = False) -> "Move":
+        """Return the shared Move for these squares and pieces, creating it on first use."""
+        key = (start_sq | end_sq << 6 | PIECE_CODES[piece_move] << 12 | PIECE_CODES[piece_captured] << 16
+               | is_enpassant_move << 20 | is_castle_move << 21)
+        move = cls._table.get(key)
+        if move is None:
+            move = cls.__new__(cls)
+            move._set(start_sq, end_sq, piece_move, piece_captured, is_enpassant_move, is_castle_move)
+            cls._table[key] = move
+        return move
+
+    def _set(self, start_sq: int, end_sq: int, piece_move: str, piece_captured: str,
+             is_enpassant_move: bool, is_castle_move: bool) -> None:
+        self.start_sq = start_sq
+        self.end_sq = end_sq
+        self.start_row, self.start_col = divmod(start_sq, 8)
+        self.end_row, self.end_col = divmod(end_sq, 8)
+        self.piece_move = piece_move
+        self.is_enpassant_move = is_enpassant_move
+        self.is_castle_move = is_castle_move
+        self.is_pawn_promotion = ((piece_move == "wp" and self.end_row == 0) or
+                                  (piece_move == "bp" and self.end_row == 7))
+        if is_enpassant_move:
+            piece_captured = "wp" if piece_move == "bp" else "bp"
+        self.piece_captured = piece_captured
+        self.is_capture = (piece_captured != "--")
         self.move_id = self.start_col * 1000 + self.start_row * 100 + self.end_col * 10 + self.end_row
-    
+
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.move_id == other.move_id
         return False
-    
+
+    def __hash__(self):
+        return self.move_id
+
+    def __repr__(self) -> str:
+        return f"Move({self.get_chess_notation()})"
+
     def get_chess_notation(self) -> str:
-        return self.get_file_rank(self.start_row, self.start_col) + self.get_file_rank(self.end_row, self.end_col)
+        return SQUARE_NAMES[self.start_sq] + SQUARE_NAMES[self.end_sq]
     
     def get_file_rank(self, row: int, col: int) -> str:
         return self.col_to_file[col] + self.row_to_rank[row]
@@ -48,7 +88,7 @@ class Move:
     def __str__(self) -> str:
         if self.is_castle_move:
             return "O-O" if self.end_col == 6 else "O-O-O"
-        end_square = self.get_file_rank(self.end_row, self.end_col)
+        end_square = SQUARE_NAMES[self.end_sq]
         if self.piece_move[1] == 'p':
             if self.is_capture:
                 return self.col_to_file[self.start_col] + "x" + end_square
@@ -66,6 +106,35 @@ class CastleRights:
     bks: bool
     bqs: bool
 
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def parse_fen(fen: str):
+    """
+    Parse a FEN string into (board rows, white_to_move, CastleRights, enpassant square).
+    The en passant square is a (row, col) tuple or () like GameState.enpassant_possible.
+    """
+    fields = fen.split()
+    board = []
+    for rank in fields[0].split('/'):
+        row = []
+        for ch in rank:
+            if ch.isdigit():
+                row.extend(["--"] * int(ch))
+            else:
+                row.append(('w' if ch.isupper() else 'b') + ('p' if ch in "Pp" else ch.upper()))
+        board.append(row)
+    if len(board) != 8 or any(len(row) != 8 for row in board):
+        raise ValueError(f"Invalid FEN board: {fields[0]}")
+    white_to_move = len(fields) < 2 or fields[1] == 'w'
+    castling = fields[2] if len(fields) > 2 else '-'
+    castle_rights = CastleRights('K' in castling, 'Q' in castling, 'k' in castling, 'q' in castling)
+    enpassant = fields[3] if len(fields) > 3 else '-'
+    if enpassant != '-':
+        enpassant = (Move.rank_to_row[enpassant[1]], Move.file_to_col[enpassant[0]])
+    else:
+        enpassant = ()
+    return board, white_to_move, castle_rights, enpassant
+
 class GameState:
     """
     Represents the current state of the chess game.
@@ -100,6 +169,7 @@ class GameState:
         self.enpassant_possible_log = [self.enpassant_possible]
         self.pins = []
         self.checks = []
+        self.enemy_attacks = None
         self.current_castling_right = CastleRights(True, True, True, True)
         self.castle_rights_log = [CastleRights(
             self.current_castling_right.wks,
@@ -107,9 +177,47 @@ class GameState:
             self.current_castling_right.bks,
             self.current_castling_right.bqs
         )]
+        self.zobrist_key = zobrist.hash_position(self.board, self.white_to_move, self._castle_index())
+        self.zobrist_log = []
+        # Per-side material and piece-square totals, read by algorithm_utils.score_board
+        self.material, self.positional = evaluation.material_and_position(self.board)
+
+    def load_fen(self, fen: str) -> None:
+        """Set up the position described by a FEN string, clearing the move history."""
+        board, self.white_to_move, self.current_castling_right, self.enpassant_possible = parse_fen(fen)
+        self.board = np.array(board)
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == "wK":
+                    self.white_king_loc = (r, c)
+                elif board[r][c] == "bK":
+                    self.black_king_loc = (r, c)
+        self.moves_log = []
+        self.in_check = self.check_mate = self.stale_mate = False
+        self.enpassant_possible_log = [self.enpassant_possible]
+        self.castle_rights_log = [copy.deepcopy(self.current_castling_right)]
+        enpassant_col = self.enpassant_possible[1] if self.enpassant_possible else -1
+        self.zobrist_key = zobrist.hash_position(self.board, self.white_to_move, self._castle_index(), enpassant_col)
+        self.zobrist_log = []
+        self.material, self.positional = evaluation.material_and_position(self.board)
+
+    def _castle_index(self) -> int:
+        rights = self.current_castling_right
+        return zobrist.castle_index(rights.wks, rights.wqs, rights.bks, rights.bqs)
     
     def make_move(self, move: Move) -> None:
         """Make the given move on the board."""
+        self.zobrist_log.append(self.zobrist_key)
+        key = self.zobrist_key ^ zobrist.SIDE_KEY ^ zobrist.CASTLE_KEYS[self._castle_index()]
+        start = move.start_sq
+        end = move.end_sq
+        key ^= zobrist.PIECE_KEYS[move.piece_move][start] ^ zobrist.PIECE_KEYS[move.piece_move][end]
+        if move.is_enpassant_move:
+            key ^= zobrist.PIECE_KEYS[move.piece_captured][move.start_row * 8 + move.end_col]
+        elif move.piece_captured != "--":
+            key ^= zobrist.PIECE_KEYS[move.piece_captured][end]
+        if self.enpassant_possible:
+            key ^= zobrist.ENPASSANT_KEYS[self.enpassant_possible[1]]
         self.board[move.start_row][move.start_col] = "--"
         self.board[move.end_row][move.end_col] = move.piece_move
         self.moves_log.append(move)
@@ -122,12 +230,14 @@ class GameState:
         if move.is_pawn_promotion:
             piece_promote = 'Q'
             self.board[move.end_row][move.end_col] = move.piece_move[0] + piece_promote
+            key ^= zobrist.PIECE_KEYS[move.piece_move][end] ^ zobrist.PIECE_KEYS[move.piece_move[0] + piece_promote][end]
         # En passant capture
         if move.is_enpassant_move:
             self.board[move.start_row][move.end_col] = "--"
         # Update en passant possibility
         if move.piece_move[1] == 'p' and abs(move.start_row - move.end_row) == 2:
             self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.end_col)
+            key ^= zobrist.ENPASSANT_KEYS[move.end_col]
         else:
             self.enpassant_possible = ()
         self.enpassant_possible_log.append(self.enpassant_possible)
@@ -139,19 +249,27 @@ class GameState:
             self.current_castling_right.bks,
             self.current_castling_right.bqs
         ))
+        key ^= zobrist.CASTLE_KEYS[self._castle_index()]
         # Handle castling move
         if move.is_castle_move:
+            rook_keys = zobrist.PIECE_KEYS[move.piece_move[0] + 'R']
             if move.end_col - move.start_col == 2:  # kingside
                 self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][move.end_col + 1]
                 self.board[move.end_row][move.end_col + 1] = "--"
+                key ^= rook_keys[end + 1] ^ rook_keys[end - 1]
             else:  # queenside
                 self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2]
                 self.board[move.end_row][move.end_col - 2] = "--"
+                key ^= rook_keys[end - 2] ^ rook_keys[end + 1]
+        self.zobrist_key = key
+        evaluation.apply_move_scores(self.material, self.positional, move, 1)
     
     def undo_move(self) -> None:
         """Undo the last move."""
         if self.moves_log:
             move = self.moves_log.pop()
+            self.zobrist_key = self.zobrist_log.pop()
+            evaluation.apply_move_scores(self.material, self.positional, move, -1)
             self.board[move.start_row][move.start_col] = move.piece_move
             self.board[move.end_row][move.end_col] = move.piece_captured
             self.white_to_move = not self.white_to_move
@@ -216,6 +334,8 @@ class GameState:
         """Return all valid moves for the current game state."""
         moves = []
         self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        # Built on first use, then every king move and castle of this node is tested against it
+        self.enemy_attacks = None
         king_row, king_col = (self.white_king_loc if self.white_to_move else self.black_king_loc)
         if self.in_check:
             if len(self.checks) == 1:
@@ -231,7 +351,9 @@ class GameState:
                         if valid_sq == (check[0], check[1]):
                             break
                 for i in range(len(moves) - 1, -1, -1):
-                    if moves[i].piece_move[1] != 'K' and (moves[i].end_row, moves[i].end_col) not in valid_squares:
+                    # En passant moves were already checked for king safety when generated
+                    if moves[i].piece_move[1] != 'K' and not moves[i].is_enpassant_move and \
+                       (moves[i].end_row, moves[i].end_col) not in valid_squares:
                         moves.pop(i)
             else:
                 self._get_king_moves(king_row, king_col, moves)
@@ -244,6 +366,10 @@ class GameState:
                 self.stale_mate = True
         return moves
 
+    def get_capture_moves(self) -> List[Move]:
+        """Return the legal captures and promotions (quiescence search moves)."""
+        return [move for move in self.get_valid_moves() if move.is_capture or move.is_pawn_promotion]
+
     def get_all_possible_moves(self) -> List[Move]:
         """Generate all possible moves for the current player."""
         moves = []
@@ -254,6 +380,13 @@ class GameState:
                     self.move_functions[piece[1]](r, c, moves)
         return moves
 
+    def _move(self, r: int, c: int, end_row: int, end_col: int, is_enpassant_move: bool = False,
+              is_castle_move: bool = False) -> Move:
+        """The shared Move from (r, c) to (end_row, end_col) on the current board, see Move.lookup."""
+        board = self.board
+        return Move.lookup(r * 8 + c, end_row * 8 + end_col, board[r, c], board[end_row, end_col],
+                           is_enpassant_move, is_castle_move)
+
     def _get_pawn_moves(self, r: int, c: int, moves: List[Move]) -> None:
         piece_pinned = False
         pin_direction = ()
@@ -263,109 +396,55 @@ class GameState:
                 pin_direction = (self.pins[i][2], self.pins[i][3])
                 self.pins.pop(i)
                 break
-        king_row, king_col = (self.white_king_loc if self.white_to_move else self.black_king_loc)
         if self.white_to_move:
-            if self.board[r-1][c] == "--" and (not piece_pinned or pin_direction == (-1, 0)):
-                moves.append(Move((r, c), (r-1, c), self.board))
+            if self.board[r-1][c] == "--" and (not piece_pinned or pin_direction in ((-1, 0), (1, 0))):
+                moves.append(self._move(r, c, r-1, c))
                 if r == 6 and self.board[r-2][c] == "--":
-                    moves.append(Move((r, c), (r-2, c), self.board))
+                    moves.append(self._move(r, c, r-2, c))
             if c-1 >= 0:
                 if self.board[r-1][c-1][0] == "b" and (not piece_pinned or pin_direction == (-1, -1)):
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
+                    moves.append(self._move(r, c, r-1, c-1))
                 elif (r-1, c-1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == r:
-                        if king_col < c:
-                            inside_range = range(king_col + 1, c)
-                            outside_range = range(c + 1, 8)
-                        else:
-                            inside_range = range(king_col - 1, c, -1)
-                            outside_range = range(c - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[r][i] != "--":
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[r][i]
-                            if square[0] == 'b' and square[1] in ['R', 'Q']:
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((r, c), (r-1, c-1), self.board, is_enpassant_move=True))
+                    move = self._move(r, c, r-1, c-1, is_enpassant_move=True)
+                    if self._is_enpassant_legal(move):
+                        moves.append(move)
             if c+1 <= 7:
                 if self.board[r-1][c+1][0] == "b" and (not piece_pinned or pin_direction == (-1, 1)):
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
+                    moves.append(self._move(r, c, r-1, c+1))
                 elif (r-1, c+1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == r:
-                        if king_col < c:
-                            inside_range = range(king_col + 1, c + 1)
-                            outside_range = range(c + 2, 8)
-                        else:
-                            inside_range = range(king_col - 1, c + 1, -1)
-                            outside_range = range(c - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[r][i] != "--":
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[r][i]
-                            if square[0] == 'b' and square[1] in ['R', 'Q']:
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((r, c), (r-1, c+1), self.board, is_enpassant_move=True))
+                    move = self._move(r, c, r-1, c+1, is_enpassant_move=True)
+                    if self._is_enpassant_legal(move):
+                        moves.append(move)
         else:
-            if self.board[r+1][c] == "--" and (not piece_pinned or pin_direction == (1, 0)):
-                moves.append(Move((r, c), (r+1, c), self.board))
+            if self.board[r+1][c] == "--" and (not piece_pinned or pin_direction in ((1, 0), (-1, 0))):
+                moves.append(self._move(r, c, r+1, c))
                 if r == 1 and self.board[r+2][c] == "--":
-                    moves.append(Move((r, c), (r+2, c), self.board))
+                    moves.append(self._move(r, c, r+2, c))
             if c-1 >= 0:
                 if self.board[r+1][c-1][0] == "w" and (not piece_pinned or pin_direction == (1, -1)):
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
+                    moves.append(self._move(r, c, r+1, c-1))
                 elif (r+1, c-1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == r:
-                        if king_col < c:
-                            inside_range = range(king_col + 1, c)
-                            outside_range = range(c + 1, 8)
-                        else:
-                            inside_range = range(king_col - 1, c, -1)
-                            outside_range = range(c - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[r][i] != "--":
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[r][i]
-                            if square[0] == 'w' and square[1] in ['R', 'Q']:
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((r, c), (r+1, c-1), self.board, is_enpassant_move=True))
+                    move = self._move(r, c, r+1, c-1, is_enpassant_move=True)
+                    if self._is_enpassant_legal(move):
+                        moves.append(move)
             if c+1 <= 7:
                 if self.board[r+1][c+1][0] == "w" and (not piece_pinned or pin_direction == (1, 1)):
-                    moves.append(Move((r, c), (r+1, c+1), self.board))
+                    moves.append(self._move(r, c, r+1, c+1))
                 elif (r+1, c+1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == r:
-                        if king_col < c:
-                            inside_range = range(king_col + 1, c + 1)
-                            outside_range = range(c + 2, 8)
-                        else:
-                            inside_range = range(king_col - 1, c + 1, -1)
-                            outside_range = range(c - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[r][i] != "--":
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[r][i]
-                            if square[0] == 'w' and square[1] in ['R', 'Q']:
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((r, c), (r+1, c+1), self.board, is_enpassant_move=True))
+                    move = self._move(r, c, r+1, c+1, is_enpassant_move=True)
+                    if self._is_enpassant_legal(move):
+                        moves.append(move)
+
+    def _is_enpassant_legal(self, move: Move) -> bool:
+        """
+        En passant removes two pawns from the same rank and may capture the checking pawn,
+        which the pin and check bookkeeping does not model, so play it and look for a check.
+        """
+        self.make_move(move)
+        king_row, king_col = self.black_king_loc if self.white_to_move else self.white_king_loc
+        in_check = self.is_square_attacked(king_row, king_col, 'w' if self.white_to_move else 'b')
+        self.undo_move()
+        return not in_check
 
     def _get_rook_moves(self, r: int, c: int, moves: List[Move]) -> None:
         piece_pinned = False
@@ -378,20 +457,16 @@ class GameState:
                     self.pins.pop(i)
                 break
         enemy_color = 'b' if self.white_to_move else 'w'
-        for d in straightDirections:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    if not piece_pinned or pin_direction in (d, (-d[0], -d[1])):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                            break
-                        else:
-                            break
+        for d, ray in zip(straightDirections, raySquares[r * 8 + c][:4]):
+            if piece_pinned and pin_direction not in (d, (-d[0], -d[1])):
+                continue
+            for end_row, end_col in ray:
+                end_piece = self.board[end_row][end_col]
+                if end_piece == "--":
+                    moves.append(self._move(r, c, end_row, end_col))
+                elif end_piece[0] == enemy_color:
+                    moves.append(self._move(r, c, end_row, end_col))
+                    break
                 else:
                     break
 
@@ -402,15 +477,12 @@ class GameState:
                 piece_pinned = True
                 self.pins.pop(i)
                 break
+        if piece_pinned:
+            return
         ally_color = 'w' if self.white_to_move else 'b'
-        for d in knightDirections:
-            end_row = r + d[0]
-            end_col = c + d[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                if not piece_pinned:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] != ally_color:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
+        for end_row, end_col in knightSquares[r * 8 + c]:
+            if self.board[end_row][end_col][0] != ally_color:
+                moves.append(self._move(r, c, end_row, end_col))
 
     def _get_bishop_moves(self, r: int, c: int, moves: List[Move]) -> None:
         piece_pinned = False
@@ -422,20 +494,16 @@ class GameState:
                 self.pins.pop(i)
                 break
         enemy_color = 'b' if self.white_to_move else 'w'
-        for d in diagonalDirections:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    if not piece_pinned or pin_direction in (d, (-d[0], -d[1])):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                            break
-                        else:
-                            break
+        for d, ray in zip(diagonalDirections, raySquares[r * 8 + c][4:]):
+            if piece_pinned and pin_direction not in (d, (-d[0], -d[1])):
+                continue
+            for end_row, end_col in ray:
+                end_piece = self.board[end_row][end_col]
+                if end_piece == "--":
+                    moves.append(self._move(r, c, end_row, end_col))
+                elif end_piece[0] == enemy_color:
+                    moves.append(self._move(r, c, end_row, end_col))
+                    break
                 else:
                     break
 
@@ -445,24 +513,9 @@ class GameState:
 
     def _get_king_moves(self, r: int, c: int, moves: List[Move]) -> None:
         ally_color = 'w' if self.white_to_move else 'b'
-        for i in range(8):
-            end_row = r + kingDirections[i][0]
-            end_col = c + kingDirections[i][1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    # Temporarily move king to check for checks
-                    if ally_color == 'w':
-                        self.white_king_loc = (end_row, end_col)
-                    else:
-                        self.black_king_loc = (end_row, end_col)
-                    in_check, _, _ = self.check_for_pins_and_checks()
-                    if not in_check:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    if ally_color == 'w':
-                        self.white_king_loc = (r, c)
-                    else:
-                        self.black_king_loc = (r, c)
+        for end_row, end_col in kingSquares[r * 8 + c]:
+            if self.board[end_row][end_col][0] != ally_color and not self._is_enemy_attacked(end_row * 8 + end_col):
+                moves.append(self._move(r, c, end_row, end_col))
         self._get_castle_moves(r, c, moves, ally_color)
 
     def check_for_pins_and_checks(self):
@@ -477,46 +530,108 @@ class GameState:
             enemy_color = 'w'
             ally_color = 'b'
             start_row, start_col = self.black_king_loc
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, 1), (1, -1)]
-        for j, d in enumerate(directions):
+        board = self.board
+        pawn_direction = -1 if enemy_color == 'b' else 1  # row step from the king to a checking pawn
+        for j, ray in enumerate(raySquares[start_row * 8 + start_col]):
+            d = rayDirections[j]
             possible_pin = ()
-            for i in range(1, 8):
-                end_row = start_row + d[0] * i
-                end_col = start_col + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color and end_piece[1] != 'K':
+            for i, (end_row, end_col) in enumerate(ray, 1):
+                end_piece = board[end_row][end_col]
+                if end_piece == "--":
+                    continue
+                if end_piece[0] == ally_color and end_piece[1] != 'K':
+                    if not possible_pin:
+                        possible_pin = (end_row, end_col, d[0], d[1])
+                        continue
+                    break
+                if end_piece[0] == enemy_color:
+                    piece_type = end_piece[1]
+                    if (j < 4 and piece_type == 'R') or \
+                       (j >= 4 and piece_type == 'B') or \
+                       (i == 1 and j >= 4 and piece_type == 'p' and d[0] == pawn_direction) or \
+                       (piece_type == 'Q') or (i == 1 and piece_type == 'K'):
                         if not possible_pin:
-                            possible_pin = (end_row, end_col, d[0], d[1])
-                        else:
-                            break
-                    elif end_piece[0] == enemy_color:
-                        piece_type = end_piece[1]
-                        if (0 <= j <= 3 and piece_type == 'R') or \
-                           (4 <= j <= 7 and piece_type == 'B') or \
-                           (i == 1 and piece_type == 'p' and ((enemy_color == 'b' and 4 <= j <= 5) or (enemy_color == 'w' and 6 <= j <= 7))) or \
-                           (piece_type == 'Q') or (i == 1 and piece_type == 'K'):
-                            if not possible_pin:
-                                in_check = True
-                                checks.append((end_row, end_col, d[0], d[1]))
-                                break
-                            else:
-                                pins.append(possible_pin)
-                                break
+                            in_check = True
+                            checks.append((end_row, end_col, d[0], d[1]))
                         else:
-                            break
-                else:
-                    break
-        for m in knightDirections:
-            end_row = start_row + m[0]
-            end_col = start_col + m[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == 'N':
-                    in_check = True
-                    checks.append((end_row, end_col, m[0], m[1]))
+                            pins.append(possible_pin)
+                break
+        enemy_knight = enemy_color + 'N'
+        for end_row, end_col in knightSquares[start_row * 8 + start_col]:
+            if board[end_row][end_col] == enemy_knight:
+                in_check = True
+                checks.append((end_row, end_col, end_row - start_row, end_col - start_col))
         return in_check, pins, checks
 
+    def is_square_attacked(self, row: int, col: int, by_color: str) -> bool:
+        """Whether any piece of by_color attacks the square, whatever stands on it."""
+        board = self.board
+        sq = row * 8 + col
+        for end_row, end_col in knightSquares[sq]:
+            if board[end_row][end_col] == by_color + 'N':
+                return True
+        # A pawn attacks this square from where a pawn of the other color here would capture
+        for end_row, end_col in pawnAttackSquares['b' if by_color == 'w' else 'w'][sq]:
+            if board[end_row][end_col] == by_color + 'p':
+                return True
+        for end_row, end_col in kingSquares[sq]:
+            if board[end_row][end_col] == by_color + 'K':
+                return True
+        for j, ray in enumerate(raySquares[sq]):
+            sliders = ('R', 'Q') if j < 4 else ('B', 'Q')
+            for end_row, end_col in ray:
+                piece = board[end_row][end_col]
+                if piece != "--":
+                    if piece[0] == by_color and piece[1] in sliders:
+                        return True
+                    break
+        return False
+
+    def _is_enemy_attacked(self, sq: int) -> bool:
+        if self.enemy_attacks is None:
+            self.enemy_attacks = self._get_enemy_attacks()
+        return self.enemy_attacks[sq]
+
+    def _get_enemy_attacks(self) -> List[bool]:
+        """
+        Squares attacked by the side not to move, indexed row * 8 + col. Sliders see
+        through the king under attack, so it cannot step back along a checking ray.
+        """
+        board = self.board.tolist()  # plain lists index much faster than the array
+        enemy_color = 'b' if self.white_to_move else 'w'
+        ally_king = 'wK' if self.white_to_move else 'bK'
+        attacked = [False] * 64
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece[0] != enemy_color:
+                    continue
+                sq = r * 8 + c
+                piece_type = piece[1]
+                if piece_type == 'p':
+                    targets = pawnAttackSquares[enemy_color][sq]
+                elif piece_type == 'N':
+                    targets = knightSquares[sq]
+                elif piece_type == 'K':
+                    targets = kingSquares[sq]
+                else:
+                    rays = raySquares[sq]
+                    if piece_type == 'R':
+                        rays = rays[:4]
+                    elif piece_type == 'B':
+                        rays = rays[4:]
+                    for ray in rays:
+                        for end_row, end_col in ray:
+                            attacked[end_row * 8 + end_col] = True
+                            end_piece = board[end_row][end_col]
+                            if end_piece != "--" and end_piece != ally_king:
+                                break
+                    continue
+                for end_row, end_col in targets:
+                    attacked[end_row * 8 + end_col] = True
+        return attacked
+
     def _get_castle_moves(self, r: int, c: int, moves: List[Move], ally_color: str) -> None:
         if self.in_check:
             return
@@ -526,44 +641,12 @@ class GameState:
             self._get_queenside_castle_move(r, c, moves, ally_color)
 
     def _get_kingside_castle_move(self, r: int, c: int, moves: List[Move], ally_color: str) -> None:
-        if self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
-            if ally_color == 'w':
-                self.white_king_loc = (r, c+1)
-            else:
-                self.black_king_loc = (r, c+1)
-            in_check1, _, _ = self.check_for_pins_and_checks()
-            if ally_color == 'w':
-                self.white_king_loc = (r, c+2)
-            else:
-                self.black_king_loc = (r, c+2)
-            in_check2, _, _ = self.check_for_pins_and_checks()
-            if ally_color == 'w':
-                self.white_king_loc = (r, c)
-            else:
-                self.black_king_loc = (r, c)
-            if not in_check1 and not in_check2:
-                moves.append(Move((r, c), (r, c+2), self.board, is_castle_move=True))
+        if self.board[r][c+1] == "--" and self.board[r][c+2] == "--" and \
+           not self._is_enemy_attacked(r * 8 + c + 1) and not self._is_enemy_attacked(r * 8 + c + 2):
+            moves.append(self._move(r, c, r, c+2, is_castle_move=True))
 
     def _get_queenside_castle_move(self, r: int, c: int, moves: List[Move], ally_color: str) -> None:
-        if self.board[r][c-1] == "--" and self.board[r][c-2] == "--" and self.board[r][c-3] == "--":
-            if ally_color == 'w':
-                self.white_king_loc = (r, c-1)
-            else:
-                self.black_king_loc = (r, c-1)
-            in_check1, _, _ = self.check_for_pins_and_checks()
-            if ally_color == 'w':
-                self.white_king_loc = (r, c-2)
-            else:
-                self.black_king_loc = (r, c-2)
-            in_check2, _, _ = self.check_for_pins_and_checks()
-            if ally_color == 'w':
-                self.white_king_loc = (r, c-3)
-            else:
-                self.black_king_loc = (r, c-3)
-            in_check3, _, _ = self.check_for_pins_and_checks()
-            if ally_color == 'w':
-                self.white_king_loc = (r, c)
-            else:
-                self.black_king_loc = (r, c)
-            if not in_check1 and not in_check2 and not in_check3:
-                moves.append(Move((r, c), (r, c-2), self.board, is_castle_move=True))
+        # The king does not pass the b-file square, it only has to be empty
+        if self.board[r][c-1] == "--" and self.board[r][c-2] == "--" and self.board[r][c-3] == "--" and \
+           not self._is_enemy_attacked(r * 8 + c - 1) and not self._is_enemy_attacked(r * 8 + c - 2):
+            moves.append(self._move(r, c, r, c-2, is_castle_move=True))
@@ -1,50 +1,162 @@
 import numpy as np
 import algorithm_utils  # for score_board
-from chess_engine import GameState, Move
+from chess_engine import GameState, Move, PIECE_CODES
+from bitboard_engine import BitboardGameState
+
+STATE_SIZE = 64 * 13 + 1  # one-hot square encodings plus the turn indicator
+ILLEGAL_MOVE_PENALTY = -0.5
+ONE_HOT_CODES = np.eye(13, dtype=np.float32)  # row per piece code
+ALL_ACTIONS = -1  # legal-action count of a stored state whose legal actions are unknown
+LEGAL_ACTIONS_PER_STATE = 48  # room replay storage reserves per state, positions average about 30
+
+
+def observation_to_codes(observation):
+    """Compact form of a flat observation: (uint8[64] piece codes, white to move)."""
+    observation = np.asarray(observation)
+    return observation[:-1].reshape(64, 13).argmax(axis=1).astype(np.uint8), bool(observation[-1] > 0.5)
+
+
+def codes_to_observations(boards, white_to_move):
+    """Flat observations [N, STATE_SIZE] from piece codes [N, 64] and turn flags [N]."""
+    observations = np.empty((len(boards), STATE_SIZE), dtype=np.float32)
+    observations[:, :-1] = ONE_HOT_CODES[boards].reshape(len(boards), -1)
+    observations[:, -1] = white_to_move
+    return observations
+
+
+def legal_action_masks(actions, counts):
+    """
+    Bool masks [N, 4096] from the legal actions of N states stored back to back:
+    actions holds the counts[0] action indices of the first state, then those of
+    the second, and so on. A count of ALL_ACTIONS allows every action.
+    """
+    counts = np.asarray(counts)
+    masks = np.zeros((len(counts), 64 * 64), dtype=bool)
+    masks[counts == ALL_ACTIONS] = True
+    masks[np.repeat(np.arange(len(counts)), np.maximum(counts, 0)), actions] = True
+    return masks
+
+def make_move_reward(game, move: Move) -> float:
+    """
+    Make move on game and return its dense reward: the change in board
+    evaluation score, from the side that moved. Call before the replies are
+    generated, or a mate would score as check_mate; terminal_reward adds the outcome.
+    """
+    # Compute the board evaluation score before the move
+    old_score = algorithm_utils.score_board(game)
+    game.make_move(move)
+    new_score = algorithm_utils.score_board(game)
+    # Since the turn flips after a move, determine which side just moved:
+    # If game.white_to_move is now True, then Black just moved; if False, then White just moved.
+    if not game.white_to_move:
+        # White just moved; reward is the improvement in score (new - old)
+        return new_score - old_score
+    # Black just moved; reward is the improvement for Black (old - new)
+    return old_score - new_score
+
+def terminal_reward(game):
+    """(Terminal bonus, done) after a move, once the legal replies of game have been generated."""
+    if game.check_mate:
+        # Add a terminal bonus: +1 for win (from the perspective of the mover), -1 for loss
+        return (1 if not game.white_to_move else -1), True
+    return 0, game.stale_mate
 
 class ChessEnv:
     """
     A Gym-like environment wrapper for the chess engine that uses dense rewards.
     Dense reward is computed as the difference in the board evaluation score
     before and after the move.
+    Pass use_bitboard=True to run the games on the bitboard move generator.
+
+    Observations are kept in one preallocated buffer that each move patches only
+    on the squares it changed, and are handed out as read-only views of it: they
+    stay valid until the next reset or step, so copy them to keep them.
+    plane_observations=True switches from the flat 833-float vector to uint8
+    planes [12, 8, 8], one per piece type (white pawn to black king) with a 1 on
+    the squares holding it; that layout has no turn indicator, the side to move
+    is game.white_to_move.
+
+    The legal actions of the current position are kept the same way, as the
+    read-only bool [4096] action_mask (also returned in the info of every step)
+    and the valid_moves dict from action index to Move.
     """
-    def __init__(self):
+    def __init__(self, use_bitboard=False, plane_observations=False):
         self.action_space = 64 * 64  # 4096 possible moves
+        self.use_bitboard = use_bitboard
+        self.plane_observations = plane_observations
+        if plane_observations:
+            self._observation = np.zeros((12, 8, 8), dtype=np.uint8)
+            self._squares = self._observation.reshape(12, 64)  # [piece code - 1, square]
+        else:
+            self._observation = np.zeros(STATE_SIZE, dtype=np.float32)
+            self._squares = self._observation[:-1].reshape(64, 13)  # [square, piece code]
+        self._observation_view = self._observation.view()
+        self._observation_view.flags.writeable = False
+        self._action_mask = np.zeros(self.action_space, dtype=bool)
+        self.action_mask = self._action_mask.view()
+        self.action_mask.flags.writeable = False
+        self.valid_moves = {}
         self.reset()
     
     def reset(self):
-        self.game = GameState()
+        self.game = BitboardGameState() if self.use_bitboard else GameState()
+        self._update_valid_moves()
         return self._get_state_vector()
+
+    def _update_valid_moves(self):
+        """
+        Generate the legal moves once per position and mark them in the action
+        mask. This also sets game.check_mate and game.stale_mate for the position.
+        """
+        self._action_mask[list(self.valid_moves)] = False
+        self.valid_moves = {move.start_sq * 64 + move.end_sq: move for move in self.game.get_valid_moves()}
+        self._action_mask[list(self.valid_moves)] = True
     
     def _get_state_vector(self):
         """
-        Encodes the current board state into a flat vector.
-        Each square is one-hot encoded with 13 features:
-          0: empty, 1-6: white pieces, 7-12: black pieces.
-        An extra feature indicates whose turn it is.
+        Encodes the whole board into the observation buffer.
+        In the flat layout each square is one-hot encoded with 13 features
+        (0: empty, 1-6: white pieces, 7-12: black pieces) and an extra feature
+        indicates whose turn it is.
         """
-        piece_to_idx = {
-            "--": 0,
-            "wp": 1, "wN": 2, "wB": 3, "wR": 4, "wQ": 5, "wK": 6,
-            "bp": 7, "bN": 8, "bB": 9, "bR": 10, "bQ": 11, "bK": 12
-        }
-        state = []
-        for row in self.game.board:
-            for square in row:
-                one_hot = [0] * 13
-                one_hot[piece_to_idx[square]] = 1
-                state.extend(one_hot)
-        # Append turn indicator: 1 for white's turn, 0 for black's turn
-        state.append(1 if self.game.white_to_move else 0)
-        return np.array(state, dtype=np.float32)
+        codes = np.array([PIECE_CODES[square] for row in self.game.board for square in row])
+        if self.plane_observations:
+            self._squares[:] = codes == np.arange(1, 13)[:, None]
+        else:
+            self._squares[:] = codes[:, None] == np.arange(13)
+            # Turn indicator: 1 for white's turn, 0 for black's turn
+            self._observation[-1] = self.game.white_to_move
+        return self._observation_view
+
+    def _update_state_vector(self, move: Move):
+        """Re-encode only the squares the move just made changed."""
+        squares = [move.start_sq, move.end_sq]
+        if move.is_enpassant_move:
+            squares.append(move.start_row * 8 + move.end_col)
+        elif move.is_castle_move:
+            if move.end_col > move.start_col:
+                squares += [move.end_sq + 1, move.end_sq - 1]
+            else:
+                squares += [move.end_sq - 2, move.end_sq + 1]
+        board = self.game.board
+        for sq in squares:
+            code = PIECE_CODES[board[sq >> 3][sq & 7]]
+            if self.plane_observations:
+                self._squares[:, sq] = 0
+                if code:
+                    self._squares[code - 1, sq] = 1
+            else:
+                self._squares[sq] = 0
+                self._squares[sq, code] = 1
+        if not self.plane_observations:
+            self._observation[-1] = self.game.white_to_move
+        return self._observation_view
     
     def move_to_action_index(self, move: Move) -> int:
         """
         Encodes a move as an integer in [0, 4095] based on starting and ending squares.
         """
-        start_index = move.start_row * 8 + move.start_col
-        end_index = move.end_row * 8 + move.end_col
-        return start_index * 64 + end_index
+        return move.start_sq * 64 + move.end_sq
 
     def decode_action(self, action_idx: int):
         """
@@ -61,43 +173,151 @@ class ChessEnv:
         Executes the action corresponding to action_idx.
         Computes the dense reward as the change in board evaluation score.
         Returns: next_state, reward, done, info
+        info["action_mask"] holds the legal actions of next_state.
         """
-        valid_moves = self.game.get_valid_moves()
-        valid_moves_map = {self.move_to_action_index(m): m for m in valid_moves}
-        
-        if action_idx not in valid_moves_map:
+        move = self.valid_moves.get(action_idx)
+        if move is None:
             # Illegal move penalty
-            reward = -0.5
+            reward = ILLEGAL_MOVE_PENALTY
             done = False
-            return self._get_state_vector(), reward, done, {"illegal_move": True}
-        
-        # Compute the board evaluation score before the move
-        old_score = algorithm_utils.score_board(self.game)
-        
-        move = valid_moves_map[action_idx]
-        self.game.make_move(move)
+            return self._observation_view, reward, done, {"illegal_move": True, "action_mask": self.action_mask}
         
-        # Compute the board evaluation score after the move
-        new_score = algorithm_utils.score_board(self.game)
+        reward = make_move_reward(self.game, move)
+        # The game only knows about mate once the replies have been generated
+        self._update_valid_moves()
+        bonus, done = terminal_reward(self.game)
+        reward += bonus
         
-        # Since the turn flips after a move, determine which side just moved:
-        # If game.white_to_move is now True, then Black just moved; if False, then White just moved.
-        if not self.game.white_to_move:
-            # White just moved; reward is the improvement in score (new - old)
-            reward = new_score - old_score
-        else:
-            # Black just moved; reward is the improvement for Black (old - new)
-            reward = old_score - new_score
-        
-        # Check terminal conditions (if game is over, optionally add terminal bonus)
-        if self.game.check_mate:
-            # Add a terminal bonus: +1 for win (from the perspective of the mover), -1 for loss
-            reward += 1 if not self.game.white_to_move else -1
-            done = True
-        elif self.game.stale_mate:
-            done = True
+        return self._update_state_vector(move), reward, done, {"action_mask": self.action_mask}
+
+
+
+class BatchChessEnv:
+    """
+    Steps num_envs independent games at once. The positions are mirrored in
+    contiguous arrays (boards holds PIECE_CODES per square, plus the side to move,
+    castling rights and en passant square of every game) which are patched in bulk
+    after each step, and the observations of all games are encoded from them in a
+    single vectorized pass, in the same 833-value layout as ChessEnv.
+    Finished games are reset automatically, as are games that reach max_moves
+    moves when it is set.
+    """
+    def __init__(self, num_envs: int, use_bitboard=True, max_moves=None):
+        self.num_envs = num_envs
+        self.max_moves = max_moves
+        self.action_space = 64 * 64
+        self.use_bitboard = use_bitboard
+        self.boards = np.zeros((num_envs, 64), dtype=np.uint8)
+        self.white_to_move = np.ones(num_envs, dtype=bool)
+        self.castle_rights = np.zeros(num_envs, dtype=np.uint8)  # wks = 1, wqs = 2, bks = 4, bqs = 8
+        self.enpassant = np.full(num_envs, -1, dtype=np.int8)  # square, or -1
+        self.moves = np.zeros(num_envs, dtype=np.int32)  # moves played in each game
+        self.games = [None] * num_envs
+        # Legal moves of every game keyed by action index, refreshed after each move
+        self.valid_moves = [None] * num_envs
+        self.action_masks = np.zeros((num_envs, self.action_space), dtype=bool)
+        self.reset()
+
+    def reset(self):
+        for i in range(self.num_envs):
+            self._reset_game(i)
+        return self._encode(np.arange(self.num_envs))
+
+    def _reset_game(self, i: int) -> None:
+        game = BitboardGameState() if self.use_bitboard else GameState()
+        self.games[i] = game
+        self.moves[i] = 0
+        self.boards[i] = [PIECE_CODES[piece] for row in game.board for piece in row]
+        self._refresh(i, game)
+
+    def _refresh(self, i: int, game) -> None:
+        self.white_to_move[i] = game.white_to_move
+        if self.use_bitboard:
+            self.castle_rights[i] = game.castle_rights
+            self.enpassant[i] = game.enpassant_square
         else:
-            done = False
-        
-        return self._get_state_vector(), reward, done, {}
+            self.castle_rights[i] = game._castle_index()
+            self.enpassant[i] = game.enpassant_possible[0] * 8 + game.enpassant_possible[1] if game.enpassant_possible else -1
+        self.valid_moves[i] = {move.start_sq * 64 + move.end_sq: move for move in game.get_valid_moves()}
+        self.action_masks[i] = False
+        self.action_masks[i, list(self.valid_moves[i])] = True
+
+    def _encode(self, indices: np.ndarray) -> np.ndarray:
+        """Observations of the given games, [len(indices), STATE_SIZE] float32."""
+        observations = np.empty((len(indices), STATE_SIZE), dtype=np.float32)
+        planes = observations[:, :-1].reshape(len(indices), 64, 13)
+        np.equal(self.boards[indices, :, None], np.arange(13, dtype=np.uint8), out=planes, casting="unsafe")
+        observations[:, -1] = self.white_to_move[indices]
+        return observations
+
+    def _apply_moves(self, indices: list, moves: list) -> None:
+        """Patch the board arrays of the games in indices with the moves they just made."""
+        indices = np.array(indices, dtype=np.intp)
+        starts = np.array([move.start_sq for move in moves], dtype=np.intp)
+        ends = np.array([move.end_sq for move in moves], dtype=np.intp)
+        pieces = self.boards[indices, starts]
+        promotions = np.array([move.is_pawn_promotion for move in moves], dtype=bool)
+        white = pieces < PIECE_CODES["bp"]
+        pieces[promotions] = np.where(white[promotions], PIECE_CODES["wQ"], PIECE_CODES["bQ"])
+        self.boards[indices, starts] = 0
+        self.boards[indices, ends] = pieces
+        # En passant removes the pawn beside the start square, castling moves the rook too
+        enpassant = np.array([move.is_enpassant_move for move in moves], dtype=bool)
+        captured = starts[enpassant] - starts[enpassant] % 8 + ends[enpassant] % 8
+        self.boards[indices[enpassant], captured] = 0
+        castles = np.array([move.is_castle_move for move in moves], dtype=bool)
+        kingside = ends[castles] > starts[castles]
+        rook_from = np.where(kingside, ends[castles] + 1, ends[castles] - 2)
+        rook_to = np.where(kingside, ends[castles] - 1, ends[castles] + 1)
+        castle_games = indices[castles]
+        self.boards[castle_games, rook_to] = self.boards[castle_games, rook_from]
+        self.boards[castle_games, rook_from] = 0
 
+    def step(self, actions):
+        """
+        Play one action in every game. Returns observations [N, STATE_SIZE],
+        rewards [N], done flags [N] and an info dict of per-game arrays:
+        illegal_move, truncated (the game was reset at max_moves without
+        finishing), action_mask (a copy of action_masks, the legal actions
+        matching observations), and final_observation, the last observation of
+        every game that finished or was truncated this step, in game order (their
+        rows in observations already show the position after the automatic reset),
+        with its legal actions in final_action_mask.
+        Rewards are those of ChessEnv.step (make_move_reward and terminal_reward).
+        """
+        actions = np.asarray(actions)
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        illegal = np.zeros(self.num_envs, dtype=bool)
+        moved, moves = [], []
+        for i in range(self.num_envs):
+            move = self.valid_moves[i].get(int(actions[i]))
+            if move is None:
+                rewards[i] = ILLEGAL_MOVE_PENALTY
+                illegal[i] = True
+                continue
+            game = self.games[i]
+            reward = make_move_reward(game, move)
+            self._refresh(i, game)
+            bonus, dones[i] = terminal_reward(game)
+            rewards[i] = reward + bonus
+            moved.append(i)
+            moves.append(move)
+        if moved:
+            self._apply_moves(moved, moves)
+            self.moves[moved] += 1
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        if self.max_moves is not None:
+            truncated = (self.moves >= self.max_moves) & ~dones
+        observations = self._encode(np.arange(self.num_envs))
+        finished = np.flatnonzero(dones | truncated)
+        final_observations = observations[finished]
+        final_action_masks = self.action_masks[finished]
+        if len(finished):
+            for i in finished:
+                self._reset_game(i)
+            observations[finished] = self._encode(finished)
+        return observations, rewards, dones, {"illegal_move": illegal, "truncated": truncated,
+                                              "action_mask": self.action_masks.copy(),
+                                              "final_observation": final_observations,
+                                              "final_action_mask": final_action_masks}
@@ -0,0 +1,121 @@
+# Piece evaluation scores
+pieceScore = {"K": 0, "Q": 90, "R": 50, "B": 35, "N": 30, "p": 10}
+
+# Position score matrices for non-king pieces
+knightScore = [[1, 1, 1, 1, 1, 1, 1, 1],
+               [1, 2, 2, 2, 2, 2, 2, 1],
+               [1, 2, 3, 3, 3, 3, 2, 1],
+               [1, 2, 3, 4, 4, 3, 2, 1],
+               [1, 2, 3, 4, 4, 3, 2, 1],
+               [1, 2, 3, 3, 3, 3, 2, 1],
+               [1, 2, 2, 2, 2, 2, 2, 1],
+               [1, 1, 1, 1, 1, 1, 1, 1]]
+
+bishopScore = [[4, 3, 2, 1, 1, 2, 3, 4],
+               [3, 4, 3, 2, 2, 3, 4, 3],
+               [2, 3, 4, 3, 3, 4, 3, 2],
+               [1, 2, 3, 4, 4, 3, 2, 1],
+               [1, 2, 3, 4, 4, 3, 2, 1],
+               [2, 3, 4, 3, 3, 4, 3, 2],
+               [3, 4, 3, 2, 2, 3, 4, 3],
+               [4, 3, 2, 1, 1, 2, 3, 4]]
+
+queenScore = [[1, 1, 1, 3, 1, 1, 1, 1],
+              [1, 2, 3, 3, 3, 1, 1, 1],
+              [1, 4, 3, 3, 3, 4, 2, 1],
+              [1, 2, 3, 3, 3, 2, 2, 1],
+              [1, 2, 3, 3, 3, 2, 2, 1],
+              [1, 4, 3, 3, 3, 4, 2, 1],
+              [1, 2, 3, 3, 3, 1, 1, 1],
+              [1, 1, 1, 3, 1, 1, 1, 1]]
+
+rookScore = [[4, 3, 4, 4, 4, 4, 3, 4],
+             [4, 4, 4, 4, 4, 4, 4, 4],
+             [1, 1, 2, 3, 3, 2, 1, 1],
+             [1, 2, 3, 4, 4, 3, 2, 1],
+             [1, 2, 3, 4, 4, 3, 2, 1],
+             [1, 1, 2, 3, 3, 2, 1, 1],
+             [4, 4, 4, 4, 4, 4, 4, 4],
+             [4, 3, 4, 4, 4, 4, 3, 4]]
+
+whitePawnScore = [[8, 8, 8, 8, 8, 8, 8, 8],
+                  [8, 8, 8, 8, 8, 8, 8, 8],
+                  [5, 6, 6, 7, 7, 6, 6, 5],
+                  [2, 3, 3, 5, 5, 3, 3, 2],
+                  [1, 2, 3, 4, 4, 3, 2, 1],
+                  [1, 2, 3, 3, 3, 3, 2, 1],
+                  [1, 1, 1, 0, 0, 1, 1, 1],
+                  [0, 0, 0, 0, 0, 0, 0, 0]]
+
+blackPawnScore = [[0, 0, 0, 0, 0, 0, 0, 0],
+                  [1, 1, 1, 0, 0, 1, 1, 1],
+                  [1, 2, 3, 3, 3, 3, 2, 1],
+                  [1, 2, 3, 4, 4, 3, 2, 1],
+                  [2, 3, 3, 5, 5, 3, 3, 2],
+                  [5, 6, 6, 7, 7, 6, 6, 5],
+                  [8, 8, 8, 8, 8, 8, 8, 8],
+                  [8, 8, 8, 8, 8, 8, 8, 8]]
+
+piecePosScores = {
+    'N': knightScore,
+    'B': bishopScore,
+    'Q': queenScore,
+    'R': rookScore,
+    "wp": whitePawnScore,
+    "bp": blackPawnScore
+}
+
+# Flattened per-piece tables indexed by square (row * 8 + col), used by GameState to keep
+# its material and piece-square totals up to date incrementally
+pieceValues = {color + kind: value for color in "wb" for kind, value in pieceScore.items()}
+pieceSquareScores = {}
+for _color in "wb":
+    for _kind in pieceScore:
+        if _kind == "K":
+            _table = [[0] * 8 for _ in range(8)]
+        elif _kind == "p":
+            _table = piecePosScores[_color + _kind]
+        else:
+            _table = piecePosScores[_kind]
+        pieceSquareScores[_color + _kind] = [_table[r][c] for r in range(8) for c in range(8)]
+
+
+def material_and_position(board):
+    """Compute the per-side material and piece-square totals of a board from scratch."""
+    material = {'w': 0, 'b': 0}
+    positional = {'w': 0, 'b': 0}
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != "--":
+                material[piece[0]] += pieceValues[piece]
+                positional[piece[0]] += pieceSquareScores[piece][r * 8 + c]
+    return material, positional
+
+
+def apply_move_scores(material, positional, move, sign: int) -> None:
+    """
+    Add (sign=1, from make_move) or take back (sign=-1, from undo_move) the change a move
+    makes to the per-side material and piece-square totals.
+    """
+    piece = move.piece_move
+    color = piece[0]
+    table = pieceSquareScores[piece]
+    start = move.start_sq
+    end = move.end_sq
+    positional[color] += sign * (table[end] - table[start])
+    captured = move.piece_captured
+    if captured != "--":
+        captured_sq = move.start_row * 8 + move.end_col if move.is_enpassant_move else end
+        material[captured[0]] -= sign * pieceValues[captured]
+        positional[captured[0]] -= sign * pieceSquareScores[captured][captured_sq]
+    if move.is_pawn_promotion:
+        queen = color + 'Q'
+        material[color] += sign * (pieceValues[queen] - pieceValues[piece])
+        positional[color] += sign * (pieceSquareScores[queen][end] - table[end])
+    elif move.is_castle_move:
+        rook_table = pieceSquareScores[color + 'R']
+        if move.end_col - move.start_col == 2:  # kingside
+            positional[color] += sign * (rook_table[end - 1] - rook_table[end + 1])
+        else:  # queenside
+            positional[color] += sign * (rook_table[end + 1] - rook_table[end - 2])
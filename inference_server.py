@@ -0,0 +1,109 @@
+"""
+Batched DQN inference for many concurrent games. Callers on any number of
+threads submit (observation, legal-action mask) requests; a server thread
+gathers them into micro-batches of up to max_batch_size, waiting at most
+max_wait seconds after the first request for more to arrive, runs one forward
+pass per batch and hands every caller its action through a Future.
+
+    with InferenceServer(agent.policy_net, max_batch_size=64) as server:
+        action = server.select_action(state, env.action_mask)   # from each game thread
+
+Requests are answered greedily; callers that explore do so before asking.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+import torch
+from agent import masked_greedy_actions
+
+
+class InferenceServer:
+    def __init__(self, net, max_batch_size: int = 64, max_wait: float = 0.002, device=torch.device("cpu")):
+        self.net = net
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.device = device
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()  # held around every forward pass
+        self.batches = 0
+        self.served = 0
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="inference-server", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Answer the requests already submitted, then stop the server thread."""
+        if self._thread is not None:
+            self.requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def submit(self, state, action_mask) -> Future:
+        """Queue one observation with its bool [4096] legal-action mask, the Future resolves to the action."""
+        future = Future()
+        self.requests.put((state, action_mask, future))
+        return future
+
+    def select_action(self, state, action_mask, timeout=None) -> int:
+        return self.submit(state, action_mask).result(timeout)
+
+    def load_state_dict(self, state_dict) -> None:
+        """Swap in new weights between batches."""
+        with self.lock:
+            self.net.load_state_dict(state_dict)
+
+    def _collect(self):
+        """Block for a request, then gather more until the batch is full or max_wait has passed."""
+        batch = [self.requests.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if request is None:  # stop once this batch is answered
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [request for request in batch if request[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                with self.lock:
+                    actions = masked_greedy_actions(self.net, np.stack([request[0] for request in batch]),
+                                                    np.stack([request[1] for request in batch]), self.device)
+            except Exception as error:
+                for request in batch:
+                    request[2].set_exception(error)
+                continue
+            for request, action in zip(batch, actions):
+                request[2].set_result(int(action))
+            self.batches += 1
+            self.served += len(batch)
@@ -1,8 +1,15 @@
+import copy
 import math
+import os
+import threading
 import pygame as p
 import chess_engine 
 from chess_engine import Move, GameState
+from bitboard_engine import BitboardGameState
 import algorithm_utils
+from algorithm_utils import Searcher, CancellationToken
+from opening_book import OpeningBook
+from tablebase import Tablebases
 
 
 WIDTH = HEIGHT = 512
@@ -10,8 +17,22 @@ MOVE_LOG_PANEL_WIDTH = 290
 MOVE_LOG_PANEL_HEIGHT = HEIGHT
 DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION
-MAX_FPS = 240
+MAX_FPS = 240  # while something moves on screen
+IDLE_FPS = 30  # otherwise only events and the AI are polled, leaving the CPU to the search
+ANIMATION_FPS = 144  # pace of the move animation
+BOARD_RECT = p.Rect(0, 0, WIDTH, HEIGHT)
+MOVE_LOG_RECT = p.Rect(WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
+USE_BITBOARD = True  # BitboardGameState backend, about 6x the search speed of the array GameState
+OPENING_BOOK = "book.bin"  # built from openings.txt with opening_book.py, skipped if missing
+TABLEBASE_DIR = "tablebases"  # endgame tables built with tablebase.py, skipped if missing
+AI_WORKERS = 1  # search processes for the AI, more than 1 uses a parallel root search
+AI_PONDER = False  # search the predicted reply while the human is thinking
 IMAGES = {}
+# Rendering caches, filled on first use
+BOARD_SURFACE = None
+FONTS = {}
+HIGHLIGHTS = {}
+MOVE_LOG_LINES = {}
 
 def load_images():
     """
@@ -22,12 +43,76 @@ def load_images():
         IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
 
 
+def new_game_state():
+    return BitboardGameState() if USE_BITBOARD else chess_engine.GameState()
+
+
+class BackgroundSearch:
+    """
+    Runs the AI search on a copy of the position in a worker thread, so the
+    window keeps drawing and handling events while it thinks. Poll for the
+    result from the event loop; cancel() stops the search and drops it.
+    """
+    def __init__(self, searcher: Searcher):
+        self.searcher = searcher
+        self.thread = None
+        self.token = None
+        self.result = None
+        self.position_key = None  # zobrist key of the searched position
+        self.pondering = False
+
+    def start(self, gs: GameState, ponder_move: Move = None, **limits) -> None:
+        """Search gs, or with ponder_move the position after it, with Searcher.search limits."""
+        self.cancel()
+        position = copy.deepcopy(gs)
+        if ponder_move is not None:
+            position.make_move(ponder_move)
+        self.position_key = position.zobrist_key
+        self.pondering = ponder_move is not None
+        self.token = CancellationToken()
+        self.thread = threading.Thread(target=self._run, args=(position, self.token, limits), daemon=True)
+        self.thread.start()
+
+    def _run(self, position, token, limits) -> None:
+        result = self.searcher.search(position, position.get_valid_moves(), cancel=token, **limits)
+        if token is self.token:
+            self.result = result
+
+    def poll(self):
+        """The SearchResult once the search has finished, otherwise None."""
+        if self.thread is None or self.thread.is_alive():
+            return None
+        self.thread = None
+        self.pondering = False
+        result, self.result = self.result, None
+        return result
+
+    def stop(self):
+        """Stop the search and return what it found so far."""
+        if self.thread is None:
+            return None
+        self.token.cancel()
+        self.thread.join()
+        return self.poll()
+
+    def cancel(self) -> None:
+        self.stop()
+
+
 def main():
     p.init()
+    searcher = Searcher(OpeningBook(OPENING_BOOK) if os.path.isfile(OPENING_BOOK) else None,
+                        Tablebases.load(TABLEBASE_DIR) if os.path.isdir(TABLEBASE_DIR) else None,
+                        workers=AI_WORKERS)
+    ai = BackgroundSearch(searcher)
+    ai_thinking = False
+    ponder_result = None
+    animation = None  # (move, start ticks) while a move is being animated
+    board_dirty = log_dirty = True  # regions to redraw on the next frame
     screen = p.display.set_mode((WIDTH + MOVE_LOG_PANEL_WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = chess_engine.GameState()
+    gs = new_game_state()
     valid_moves = gs.get_valid_moves()
     move_made = False
     animate = False
@@ -45,6 +130,7 @@ def main():
             if e.type == p.QUIT:
                 running = False
             elif e.type == p.MOUSEBUTTONDOWN:
+                board_dirty = True
                 if not game_over and humanTurn:
                     location = p.mouse.get_pos()
                     col = location[0]//SQ_SIZE
@@ -65,9 +151,22 @@ def main():
                             sq_selected = ()
                             player_clicks = []
                             print(move.get_chess_notation())
+                            if ai.pondering:
+                                # Ponder hit: the search already ran on this position, keep its work
+                                result = ai.stop()
+                                if ai.position_key == gs.zobrist_key and result is not None \
+                                        and result.stats.depth >= algorithm_utils.MAX_DEPTH:
+                                    ponder_result = result
                         else:
                             player_clicks = [sq_selected]
             elif e.type == p.KEYDOWN:
+                if e.key in (p.K_z, p.K_r, p.K_q, p.K_e):
+                    # The position or the sides change, whatever the AI was searching is void
+                    ai.cancel()
+                    ai_thinking = False
+                    ponder_result = None
+                    animation = None
+                    board_dirty = log_dirty = True
                 if e.key == p.K_z:
                     gs.undo_move()
                     move_made = True
@@ -76,7 +175,7 @@ def main():
                     player_one = True
                     player_two = True
                 elif e.key == p.K_r:
-                    gs = chess_engine.GameState()
+                    gs = new_game_state()
                     valid_moves = gs.get_valid_moves()
                     move_made = False
                     animate = False
@@ -94,67 +193,119 @@ def main():
 
         if move_made:
             if animate:
-                animateMove(gs.moves_log[-1], screen, gs.board, clock)
+                animation = (gs.moves_log[-1], p.time.get_ticks())
             valid_moves = gs.get_valid_moves()
             move_made = False
             animate = False
+            board_dirty = log_dirty = True
 
         ''' AI move finder '''
+        humanTurn = (gs.white_to_move and player_one) or (not gs.white_to_move and player_two)  # keys may switch sides
         if not game_over and not humanTurn:
-            AIMove = algorithm_utils.find_best_move_minimax(gs, valid_moves)
-            if AIMove is None:   #when begin the game
-                AIMove = algorithm_utils.find_random_move(valid_moves)
-            gs.make_move(AIMove)
-            move_made = True
-            animate = True
-            print(AIMove.get_chess_notation())
-
+            result = None
+            if ponder_result is not None:
+                result, ponder_result = ponder_result, None
+            elif not ai_thinking:
+                ai.start(gs, randomize=True)
+                ai_thinking = True
+            else:
+                result = ai.poll()
+            if result is not None:
+                ai_thinking = False
+                print(result.stats.summary())
+                AIMove = result.move
+                if AIMove is None or AIMove not in valid_moves:   #when begin the game
+                    AIMove = algorithm_utils.find_random_move(valid_moves)
+                else:
+                    AIMove = valid_moves[valid_moves.index(AIMove)]
+                gs.make_move(AIMove)
+                move_made = True
+                animate = True
+                print(AIMove.get_chess_notation())
+                if AI_PONDER and len(result.stats.principal_variation) > 1:
+                    predicted = next((m for m in gs.get_valid_moves()
+                                      if m.get_chess_notation() == result.stats.principal_variation[1]), None)
+                    if predicted is not None:
+                        ai.start(gs, ponder_move=predicted, max_depth=algorithm_utils.MAX_ITERATIVE_DEPTH,
+                                 randomize=True)
 
-        draw_game_state(screen, gs, valid_moves, sq_selected)
 
         if gs.check_mate or gs.stale_mate:
             game_over = True
-            if gs.stale_mate:
-                game_over = True
-                drawEndGameText(screen, "DRAW")
+
+        # Redraw only the regions that changed and hand just those to the display
+        dirty_rects = []
+        if animation is not None:
+            if animateMove(animation[0], screen, gs.board, animation[1]):
+                animation = None
+                board_dirty = True
             else:
-                
-                text_to_draw = "{} WIN".format("WHITE" if gs.white_to_move else "WHITE")
-                drawEndGameText(screen, text_to_draw)
+                dirty_rects.append(BOARD_RECT)
+        if board_dirty and animation is None:
+            draw_game_state(screen, gs, valid_moves, sq_selected)
+            if game_over:
+                if gs.stale_mate:
+                    drawEndGameText(screen, "DRAW")
+                else:
+                    text_to_draw = "{} WIN".format("WHITE" if gs.white_to_move else "WHITE")
+                    drawEndGameText(screen, text_to_draw)
+            dirty_rects.append(BOARD_RECT)
+            board_dirty = False
+        if log_dirty:
+            draw_moveslog(screen, gs)
+            dirty_rects.append(MOVE_LOG_RECT)
+            log_dirty = False
+        if dirty_rects:
+            p.display.update(dirty_rects)
+        clock.tick(MAX_FPS if animation is not None else IDLE_FPS)
+    ai.cancel()
+    searcher.close()
+
+def get_font(size: int):
+    """Creating a SysFont is slow, make each size once."""
+    if size not in FONTS:
+        FONTS[size] = p.font.SysFont("Verdana", size, True, False)
+    return FONTS[size]
 
-        clock.tick(MAX_FPS)
-        p.display.flip()
+def get_highlight(color: str):
+    """Translucent square overlay of the given color."""
+    if color not in HIGHLIGHTS:
+        sq = p.Surface((SQ_SIZE, SQ_SIZE))
+        sq.set_alpha(100)
+        sq.fill(p.Color(color))
+        HIGHLIGHTS[color] = sq
+    return HIGHLIGHTS[color]
 
 def highlight_move(screen, gs: GameState, validMoves: list[Move], sqSelected):
-    sq = p.Surface((SQ_SIZE, SQ_SIZE))
-    sq.set_alpha(100)
     if sqSelected != ():
         r, c = sqSelected
         if gs.board[r][c][0] == ('w' if gs.white_to_move else 'b'): #sqSelected is a piece that can be moved
             #highlight selected square
-            sq.fill(p.Color("blue"))
-            screen.blit(sq, (c * SQ_SIZE, r * SQ_SIZE))
+            screen.blit(get_highlight("blue"), (c * SQ_SIZE, r * SQ_SIZE))
             #highlight validmoves
-            sq.fill(p.Color("cyan"))
+            sq = get_highlight("cyan")
             for move in validMoves:
                 if move.start_row == r and move.start_col == c:
                     screen.blit(sq, (move.end_col * SQ_SIZE, move.end_row * SQ_SIZE))
 
     if gs.in_check:
         if gs.white_to_move:
-            sq.fill(p.Color("red"))
-            screen.blit(sq, (gs.white_king_loc[1] * SQ_SIZE, gs.white_king_loc[0] * SQ_SIZE))
+            screen.blit(get_highlight("red"), (gs.white_king_loc[1] * SQ_SIZE, gs.white_king_loc[0] * SQ_SIZE))
         else:
-            sq.fill(p.Color("red"))
-            screen.blit(sq, (gs.black_king_loc[1] * SQ_SIZE, gs.black_king_loc[0] * SQ_SIZE))
+            screen.blit(get_highlight("red"), (gs.black_king_loc[1] * SQ_SIZE, gs.black_king_loc[0] * SQ_SIZE))
     
     if len(gs.moves_log) != 0:
-        sq.fill(p.Color("yellow"))
+        sq = get_highlight("yellow")
         screen.blit(sq, (gs.moves_log[-1].start_col * SQ_SIZE, gs.moves_log[-1].start_row * SQ_SIZE))
         screen.blit(sq, (gs.moves_log[-1].end_col * SQ_SIZE, gs.moves_log[-1].end_row * SQ_SIZE))
 
 
-def animateMove(move: Move, screen, board, clock):
+def animateMove(move: Move, screen, board, startTicks: int) -> bool:
+    """
+    Draw the frame of the move animation that is due now (board is the position
+    after the move) and return True once the animation is over. Called once per
+    frame from the event loop instead of looping here, so events keep flowing.
+    """
     colors = [p.Color("white"), p.Color("grey")]
     dR = move.end_row - move.start_row
     dC = move.end_col - move.start_col
@@ -163,35 +314,39 @@ def animateMove(move: Move, screen, board, clock):
     sqDistance = int(sqDistance)
     framesPerSquare = 12 // sqDistance
     frameCount = (abs(dR) + abs(dC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        r, c = (move.start_row + dR*frame/frameCount, move.start_col + dC*frame/frameCount)
-        draw_board(screen)
-        draw_pieces(screen, board)
-        color = colors[(move.end_row + move.end_col) % 2]
-        endSquare = p.Rect(move.end_col*SQ_SIZE, move.end_row*SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-        if move.piece_captured != "--":
-            if move.is_enpassant_move:
-                enPassantRow = (move.end_row + 1) if move.piece_captured[0] == 'b' else (move.end_row - 1)
-                endSquare = p.Rect(move.end_col*SQ_SIZE, enPassantRow*SQ_SIZE, SQ_SIZE, SQ_SIZE)
-            screen.blit(IMAGES[move.piece_captured], endSquare)
-        if move.piece_move != "--":
-            screen.blit(IMAGES[move.piece_move], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(144)
+    frame = min((p.time.get_ticks() - startTicks) * ANIMATION_FPS // 1000, frameCount)
+    r, c = (move.start_row + dR*frame/frameCount, move.start_col + dC*frame/frameCount)
+    draw_board(screen)
+    draw_pieces(screen, board)
+    color = colors[(move.end_row + move.end_col) % 2]
+    endSquare = p.Rect(move.end_col*SQ_SIZE, move.end_row*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    p.draw.rect(screen, color, endSquare)
+    if move.piece_captured != "--":
+        if move.is_enpassant_move:
+            enPassantRow = (move.end_row + 1) if move.piece_captured[0] == 'b' else (move.end_row - 1)
+            endSquare = p.Rect(move.end_col*SQ_SIZE, enPassantRow*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        screen.blit(IMAGES[move.piece_captured], endSquare)
+    if move.piece_move != "--":
+        screen.blit(IMAGES[move.piece_move], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    return frame >= frameCount
 
 def draw_game_state(screen, gs: GameState, validMoves, sqSelected):
+    """Draw the board region; the move log panel is drawn separately by draw_moveslog."""
     draw_board(screen)
     highlight_move(screen, gs, validMoves, sqSelected)
     draw_pieces(screen, gs.board)
-    draw_moveslog(screen, gs)
 
 def draw_board(screen):
-    colors = [p.Color("white"), p.Color("grey")]
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            color = colors[((r + c) % 2)]
-            p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    """Blit the empty board, rendered once on first use."""
+    global BOARD_SURFACE
+    if BOARD_SURFACE is None:
+        BOARD_SURFACE = p.Surface((WIDTH, HEIGHT))
+        colors = [p.Color("white"), p.Color("grey")]
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                color = colors[((r + c) % 2)]
+                p.draw.rect(BOARD_SURFACE, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    screen.blit(BOARD_SURFACE, (0, 0))
 
 def draw_pieces(screen, board):
     for row in range(DIMENSION):
@@ -201,7 +356,7 @@ def draw_pieces(screen, board):
                 screen.blit(IMAGES[piece], p.Rect(col*SQ_SIZE, row*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
 def drawEndGameText(screen, text):
-    font = p.font.SysFont("Verdana", 32, True, False)
+    font = get_font(32)
     textObject = font.render(text, False, p.Color("black"))
     textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
     screen.blit(textObject, textLocation)
@@ -209,7 +364,7 @@ def drawEndGameText(screen, text):
     screen.blit(textObject, textLocation.move(2, 2))
 
 def draw_moveslog(screen, gs: GameState):
-    moves_logRect = p.Rect(WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
+    moves_logRect = MOVE_LOG_RECT
     p.draw.rect(screen, p.Color("black"), moves_logRect)
     moves_log = gs.moves_log
     moveTexts = []
@@ -225,11 +380,15 @@ def draw_moveslog(screen, gs: GameState):
     textY = padding
     for i in range(0, len(moveTexts), movesPerRow):
         text = ""
-        font = p.font.SysFont("Verdana", 13, True, False)
         for j in range(movesPerRow):
             if i+j < len(moveTexts):
                 text += moveTexts[i+j]
-        textObject = font.render(text, False, p.Color("white"))
+        # Only the last line changes as moves are played, earlier ones are rendered once
+        textObject = MOVE_LOG_LINES.get(text)
+        if textObject is None:
+            if len(MOVE_LOG_LINES) > 1024:
+                MOVE_LOG_LINES.clear()
+            textObject = MOVE_LOG_LINES[text] = get_font(13).render(text, False, p.Color("white"))
         textLocation = moves_logRect.move(padding, textY)
         screen.blit(textObject, textLocation)
         textY += textObject.get_height() + lineSpacing
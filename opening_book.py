@@ -0,0 +1,162 @@
+"""
+Opening book stored as a sorted array of fixed-size binary records:
+
+    key      uint64  Zobrist key of the position (zobrist.py)
+    move     uint16  start_square * 64 + end_square
+    weight   uint16  how often the move was played from the position
+
+The file is memory-mapped and binary-searched, so a lookup only touches a few
+pages and engine processes sharing a book share them through the page cache.
+
+Build a book from game records (PGN or one game of SAN / coordinate moves per line):
+
+    python opening_book.py openings.txt book.bin --max-ply 16
+"""
+import argparse
+import mmap
+import random
+import re
+import struct
+import sys
+from collections import Counter
+from typing import Iterable, List, Optional
+from bitboard_engine import BitboardGameState
+from chess_engine import Move
+
+RECORD = struct.Struct("<QHH")
+MAX_WEIGHT = 0xFFFF
+
+_PGN_NOISE = re.compile(r"\[[^\]]*\]|\{[^}]*\}|\([^)]*\)|\$\d+|\d+\.(\.\.)?|1-0|0-1|1/2-1/2|\*")
+_COORDINATE_MOVE = re.compile(r"^[a-h][1-8][a-h][1-8][qrbn]?$")
+
+
+class OpeningBook:
+    """Read-only view of a book file. Close it (or use it as a context manager) when done."""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file, mmap cannot map zero bytes
+            self._map = b""
+        self.size = len(self._map) // RECORD.size
+
+    def close(self) -> None:
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _key_at(self, index: int) -> int:
+        return RECORD.unpack_from(self._map, index * RECORD.size)[0]
+
+    def entries(self, key: int) -> List[tuple]:
+        """(start_square, end_square, weight) of every book move from the position."""
+        lo, hi = 0, self.size
+        while lo < hi:  # leftmost record with this key
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < self.size:
+            record_key, move, weight = RECORD.unpack_from(self._map, lo * RECORD.size)
+            if record_key != key:
+                break
+            found.append((move >> 6, move & 63, weight))
+            lo += 1
+        return found
+
+    def find_move(self, gs, valid_moves: list, randomize: bool = False) -> Optional[Move]:
+        """
+        Return a book move for the position, or None when it is not in the book.
+        The most played move is chosen, or a random one weighted by how often it
+        was played when randomize is set.
+        """
+        entries = self.entries(gs.zobrist_key)
+        if not entries:
+            return None
+        legal = {(move.start_sq, move.end_sq): move for move in valid_moves}
+        # A key collision could point at moves that are illegal here
+        candidates = [(legal[start, end], weight) for start, end, weight in entries if (start, end) in legal]
+        if not candidates:
+            return None
+        if randomize:
+            return random.choices([move for move, _ in candidates], [weight for _, weight in candidates])[0]
+        return max(candidates, key=lambda candidate: candidate[1])[0]
+
+
+def parse_move(text: str, valid_moves: list) -> Optional[Move]:
+    """Match a move in coordinate ("g1f3") or standard algebraic ("Nf3") notation."""
+    text = text.rstrip("+#!?")
+    if _COORDINATE_MOVE.match(text):
+        return next((move for move in valid_moves if move.get_chess_notation() == text[:4]), None)
+    text = text.replace("0", "O")
+    if text in ("O-O", "O-O-O"):
+        return next((move for move in valid_moves if move.is_castle_move and str(move) == text), None)
+    text = text.split("=")[0].replace("x", "")
+    piece = text[0] if text[0] in "NBRQK" else "p"
+    if piece != "p":
+        text = text[1:]
+    target, disambiguation = text[-2:], text[:-2]
+    matches = [move for move in valid_moves
+               if move.piece_move[1] == piece and move.get_chess_notation()[2:] == target
+               and all(char in move.get_chess_notation()[:2] for char in disambiguation)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def read_games(text: str) -> List[List[str]]:
+    """Split PGN or one-game-per-line text into lists of move tokens."""
+    if "[" in text:  # PGN: games are separated by their tag sections
+        games = re.split(r"\n\s*\n(?=\[)", text)
+    else:
+        games = text.splitlines()
+    tokens = (_PGN_NOISE.sub(" ", game).split() for game in games)
+    return [game for game in tokens if game]
+
+
+def build_book(games: Iterable[List[str]], path: str, max_ply: int = 16, min_count: int = 1) -> int:
+    """
+    Replay the games, count the moves played in their first max_ply plies and
+    write the book. Moves played fewer than min_count times are left out.
+    Returns the number of records written.
+    """
+    counts = Counter()
+    for game in games:
+        gs = BitboardGameState()
+        for token in game[:max_ply]:
+            move = parse_move(token, gs.get_valid_moves())
+            if move is None:  # unreadable or illegal, keep what came before it
+                break
+            counts[gs.zobrist_key, move.start_sq * 64 + move.end_sq] += 1
+            gs.make_move(move)
+    records = sorted((key, move, min(count, MAX_WEIGHT)) for (key, move), count in counts.items()
+                     if count >= min_count)
+    with open(path, "wb") as book_file:
+        for record in records:
+            book_file.write(RECORD.pack(*record))
+    return len(records)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build an opening book from game records.")
+    parser.add_argument("games", help="PGN file, or one game of SAN / coordinate moves per line")
+    parser.add_argument("book", help="output book file")
+    parser.add_argument("--max-ply", type=int, default=16, help="only book the first plies of each game")
+    parser.add_argument("--min-count", type=int, default=1, help="drop moves played fewer times than this")
+    args = parser.parse_args(argv)
+    with open(args.games, encoding="utf-8") as games_file:
+        games = read_games(games_file.read())
+    records = build_book(games, args.book, args.max_ply, args.min_count)
+    print(f"{len(games)} games, {records} book moves written to {args.book}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
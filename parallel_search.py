@@ -0,0 +1,190 @@
+"""
+Parallel root search: the root moves of each iterative-deepening pass are
+spread over a pool of worker processes. Every worker keeps its own copy of the
+position and its own transposition table, and the best root score found so far
+is shared between them so later root moves are still searched with a tight
+alpha-beta window.
+
+    searcher = ParallelSearch(workers=8)   # create once, reuse for every move
+    move, stats = searcher.search(gs, gs.get_valid_moves(), time_limit=5)
+"""
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import algorithm_utils
+from algorithm_utils import check_mate, Searcher
+from search_stats import SearchStats
+from tablebase import Tablebases
+
+CANCEL_POLL = 0.05  # seconds between checks of the cancellation token while waiting on workers
+
+# Worker process state, set up by _init_worker and reused between tasks
+_shared_bound = None
+_stop = None
+_searcher = None
+_search_id = None
+_game_state = None
+# Searcher counters reported back as deltas, in the order of _COUNTER_FIELDS
+_COUNTER_FIELDS = ("nodes", "quiescence_nodes", "expanded_nodes", "cutoffs", "first_move_cutoffs", "tt_probes", "tt_hits")
+NO_COUNTS = (0,) * len(_COUNTER_FIELDS)
+
+
+class _SharedStop:
+    """Cancellation token of the workers, set by the parent through a shared flag."""
+    def __init__(self, flag):
+        self.flag = flag
+
+    @property
+    def cancelled(self) -> bool:
+        return bool(self.flag.value)
+
+
+def _init_worker(shared_bound, stop_flag, tablebase_dir) -> None:
+    global _shared_bound, _stop, _searcher
+    _shared_bound = shared_bound
+    _stop = _SharedStop(stop_flag)
+    # The tables are probed inside the tree like in the serial search, the book only at the root (by the parent)
+    _searcher = Searcher(tablebases=Tablebases.load(tablebase_dir) if tablebase_dir else None)
+
+
+def _counters() -> tuple:
+    tt = _searcher.transposition_table
+    return (_searcher.nodes, _searcher.quiescence_nodes, _searcher.expanded_nodes,
+            _searcher.cutoffs, _searcher.first_move_cutoffs, tt.probes, tt.hits)
+
+
+def _search_root_move(search_id: int, state: bytes, move_id: int, depth: int, deadline):
+    """
+    Search one root move to `depth` in a worker and return
+    (move_id, score, exact, counters, finished), counters being how much the
+    search moved each of _COUNTER_FIELDS. The window starts at the best root
+    score any worker has reported so far, so a score that does not beat it is only
+    a bound and exact is False.
+    """
+    global _search_id, _game_state
+    if search_id != _search_id:
+        # First task of a new search in this worker: load the position once and age the tables
+        _search_id = search_id
+        _game_state = pickle.loads(state)
+        _searcher.new_search()
+    if (deadline is not None and time.time() >= deadline) or _stop.cancelled:
+        return move_id, 0, False, NO_COUNTS, False
+    gs = _game_state
+    white_to_move = gs.white_to_move
+    move = next(m for m in gs.get_valid_moves() if m.move_id == move_id)
+
+    # The node counter keeps running across tasks so the budget check every
+    # BUDGET_CHECK_MASK + 1 nodes still happens when the tasks themselves are smaller than that
+    start_counters = _counters()
+    bound = _shared_bound.value
+    alpha, beta = (bound, check_mate) if white_to_move else (-check_mate, bound)
+    score, finished = _searcher.search_move(gs, move, depth, alpha, beta, deadline, _stop)
+    exact = score > alpha if white_to_move else score < beta
+    if finished:
+        with _shared_bound.get_lock():
+            if (score > _shared_bound.value) if white_to_move else (score < _shared_bound.value):
+                _shared_bound.value = score
+    counters = tuple(end - start for start, end in zip(start_counters, _counters()))
+    return move_id, score, exact, counters, finished
+
+
+class ParallelSearch:
+    """
+    Owns a process pool for parallel root searches. Creating the pool is
+    expensive, so keep one instance and call search for every move.
+    Every worker loads the tablebases from tablebase_dir, if given.
+    """
+    def __init__(self, workers: int = None, tablebase_dir: str = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.tablebase_dir = tablebase_dir
+        self.shared_bound = multiprocessing.Value('i', 0)
+        self.stop_flag = multiprocessing.Value('b', 0)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(self.shared_bound, self.stop_flag, tablebase_dir))
+        self.search_id = 0
+
+    def search(self, gs, valid_moves: list, time_limit: float = None, max_depth: int = None, on_iteration=None,
+               cancel=None):
+        """
+        Iterative deepening over the root moves, like algorithm_utils.Searcher.search.
+        Returns the best move of the last completed depth and the SearchStats,
+        whose principal variation is only the root move (every worker has its own table).
+        Cancelling cancel (a CancellationToken) stops the workers too.
+        """
+        stats = SearchStats(workers=self.workers)
+        if not valid_moves:
+            return None, stats
+        if max_depth is None:
+            max_depth = algorithm_utils.MAX_DEPTH if time_limit is None else algorithm_utils.MAX_ITERATIVE_DEPTH
+        self.search_id += 1
+        self.stop_flag.value = 0
+        start_time = time.time()
+        deadline = start_time + time_limit if time_limit is not None else None
+        state = pickle.dumps(gs)
+        white_to_move = gs.white_to_move
+        moves_by_id = {move.move_id: move for move in valid_moves}
+        # Best first: the previous iteration's scores order the next one
+        root_order = list(moves_by_id)
+        best_move = None
+        for depth in range(1, max_depth + 1):
+            if depth > 1 and ((deadline is not None and time.time() >= deadline)
+                              or (cancel is not None and cancel.cancelled)):
+                break
+            iteration_start = stats.nodes
+            with self.shared_bound.get_lock():
+                self.shared_bound.value = -check_mate if white_to_move else check_mate
+            futures = [self.pool.submit(_search_root_move, self.search_id, state, move_id, depth, deadline)
+                       for move_id in root_order]
+            scores = {}
+            finished = True
+            for i, future in enumerate(futures):
+                move_id, score, exact, counters, move_finished = self._result(future, cancel)
+                self._add_counters(stats, counters)
+                if not move_finished:
+                    finished = False
+                    # Out of time or cancelled: drop the queued moves and wait for the running ones to stop,
+                    # so none of them touches the shared bound of the next search
+                    for pending in futures[i + 1:]:
+                        if not pending.cancel():
+                            self._add_counters(stats, pending.result()[3])
+                    break
+                # Moves that failed low sort behind every exactly scored move
+                scores[move_id] = (exact, score) if white_to_move else (not exact, score)
+            stats.depth_nodes[depth] = stats.nodes - iteration_start
+            if not finished:
+                break
+            # Stable sort keeps the earlier (better ordered) move on equal scores
+            root_order.sort(key=scores.get, reverse=white_to_move)
+            best_move = moves_by_id[root_order[0]]
+            stats.depth, stats.score = depth, scores[root_order[0]][1]
+            stats.principal_variation = [best_move.get_chess_notation()]
+            stats.elapsed = time.time() - start_time
+            if on_iteration is not None:
+                on_iteration(stats)
+            if abs(stats.score) >= check_mate:  # a proven mate, deeper iterations cannot change it
+                break
+        if best_move is None:  # not even depth 1 finished in time
+            best_move = moves_by_id[root_order[0]]
+            stats.principal_variation = [best_move.get_chess_notation()]
+        stats.elapsed = time.time() - start_time
+        return best_move, stats
+
+    def _result(self, future, cancel):
+        """future.result(), raising the workers' stop flag as soon as cancel is cancelled."""
+        while cancel is not None and not self.stop_flag.value:
+            try:
+                return future.result(timeout=CANCEL_POLL)
+            except TimeoutError:
+                if cancel.cancelled:
+                    self.stop_flag.value = 1
+        return future.result()
+
+    @staticmethod
+    def _add_counters(stats: SearchStats, counters: tuple) -> None:
+        for name, count in zip(_COUNTER_FIELDS, counters):
+            setattr(stats, name, getattr(stats, name) + count)
+
+    def shutdown(self) -> None:
+        self.pool.shutdown()
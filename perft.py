@@ -0,0 +1,114 @@
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth.
+Used to prove the move generators correct against published counts and to
+measure their speed.
+
+    python perft.py --depth 4                      # start position
+    python perft.py --fen "<fen>" --depth 3 --divide
+    python perft.py --suite --backend bitboard     # regression suite
+"""
+import argparse
+import sys
+import time
+from chess_engine import GameState, START_FEN
+from bitboard_engine import BitboardGameState
+
+BACKENDS = {"array": GameState, "bitboard": BitboardGameState}
+
+# Published perft counts (chessprogramming.org/Perft_Results). The engine always promotes
+# to a queen, so only depths whose trees contain no promotions are listed.
+PERFT_SUITE = [
+    ("startpos", START_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890]),
+]
+
+
+def new_game_state(fen: str = START_FEN, backend: str = "bitboard"):
+    gs = BACKENDS[backend]()
+    gs.load_fen(fen)
+    return gs
+
+
+def perft(gs, depth: int) -> int:
+    """Number of leaf nodes `depth` plies below the current position."""
+    moves = gs.get_valid_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    count = 0
+    for move in moves:
+        gs.make_move(move)
+        count += perft(gs, depth - 1)
+        gs.undo_move()
+    return count
+
+
+def divide(gs, depth: int) -> dict:
+    """Perft count below each root move, keyed by its coordinate notation."""
+    counts = {}
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        counts[move.get_chess_notation()] = perft(gs, depth - 1)
+        gs.undo_move()
+    return counts
+
+
+def timed_perft(gs, depth: int):
+    """Return (nodes, elapsed seconds, nodes per second)."""
+    start_time = time.perf_counter()
+    nodes = perft(gs, depth)
+    elapsed = time.perf_counter() - start_time
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else float("inf")
+
+
+def run_suite(backend: str = "bitboard", max_depth: int = 4, verbose: bool = True) -> list:
+    """
+    Run PERFT_SUITE up to max_depth and return the mismatches as
+    (name, depth, expected, actual) tuples.
+    """
+    failures = []
+    for name, fen, expected_counts in PERFT_SUITE:
+        for depth, expected in enumerate(expected_counts[:max_depth], start=1):
+            nodes, elapsed, nps = timed_perft(new_game_state(fen, backend), depth)
+            ok = nodes == expected
+            if not ok:
+                failures.append((name, depth, expected, nodes))
+            if verbose:
+                print(f"{name:10} depth {depth}: {nodes:>9} {'ok' if ok else f'FAIL (expected {expected})'}"
+                      f"  {elapsed:.2f} sec, {nps:,.0f} nodes/sec")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Count move-generator leaf nodes (perft).")
+    parser.add_argument("--fen", default=START_FEN, help="position to search (default: start position)")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    parser.add_argument("--divide", action="store_true", help="print the count below each root move")
+    parser.add_argument("--suite", action="store_true", help="check the reference positions up to --depth")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        failures = run_suite(args.backend, args.depth)
+        print("all counts match" if not failures else f"{len(failures)} mismatches")
+        return 1 if failures else 0
+
+    gs = new_game_state(args.fen, args.backend)
+    if args.divide:
+        start_time = time.perf_counter()
+        counts = divide(gs, args.depth)
+        elapsed = time.perf_counter() - start_time
+        for notation in sorted(counts):
+            print(f"{notation}: {counts[notation]}")
+        nodes = sum(counts.values())
+        print(f"moves: {len(counts)}")
+    else:
+        nodes, elapsed, _ = timed_perft(gs, args.depth)
+    print(f"nodes: {nodes}, time: {elapsed:.2f} sec, {nodes / max(elapsed, 1e-9):,.0f} nodes/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Disk-backed replay store: transitions are appended to fixed-size records in
+memory-mapped shard files, so the history can outgrow RAM and survive between
+runs. Records are laid out like agent.ReplayBuffer slots (piece codes, side to
+move, action, reward, done) and a transition's next_state is the following
+record, so each state is written once. The legal actions of each state are
+appended to their own shard files as a list of action indices, which the
+record finds by offset and count: a transition takes 83 bytes plus 2 per
+legal action, some 150 bytes in a typical game.
+
+    store = ReplayStore("replay")          # creates or reopens the directory
+    store.push(state, action, reward, next_state, done, next_action_mask)
+    states, actions, rewards, next_states, dones, next_action_masks = store.sample(64)
+    store.close()
+"""
+import json
+import os
+import numpy as np
+from chess_env import (observation_to_codes, codes_to_observations, legal_action_masks, ALL_ACTIONS,
+                       LEGAL_ACTIONS_PER_STATE)
+
+RECORD_DTYPE = np.dtype([
+    ("board", np.uint8, 64),
+    ("white_to_move", np.uint8),
+    ("legal_offset", "<i8"),  # of the legal actions of board, counted over all action shards
+    ("legal_count", "<i2"),  # or ALL_ACTIONS
+    ("action", "<i2"),
+    ("reward", "<f4"),
+    ("done", np.uint8),
+    ("valid", np.uint8),  # the next record holds this transition's next_state
+])
+ACTION_DTYPE = np.dtype("<i2")
+META_FILE = "meta.json"
+FORMAT_VERSION = 3
+
+
+class ReplayStore:
+    """
+    Append-only transition store in directory, split into shard files of
+    shard_records records each (87 MB for the default), and action shard files of
+    LEGAL_ACTIONS_PER_STATE legal actions per record (100 MB). Reopening a
+    directory continues where the last run left off; shard_records is then
+    taken from the directory.
+    Push the transitions of each game in order, as for agent.ReplayBuffer.
+    """
+    def __init__(self, directory: str, shard_records: int = 1 << 20):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            if meta["version"] != FORMAT_VERSION:
+                raise ValueError(f"{directory}: unsupported replay store version {meta['version']}")
+            shard_records = meta["shard_records"]
+            self.records = meta["records"]
+            self.legal_end = meta["legal_actions"]
+            self.count = meta["transitions"]
+        else:
+            self.records = 0  # records written, the last one may be a pending next_state
+            self.legal_end = 0  # legal actions written
+            self.count = 0  # complete transitions
+        self.shard_records = shard_records
+        self.shard_actions = shard_records * LEGAL_ACTIONS_PER_STATE
+        self.shards = []
+        self.action_shards = []
+        for _ in range((self.records + shard_records - 1) // shard_records):
+            self._open_shard(self.shards, "r+")
+        for _ in range((self.legal_end + self.shard_actions - 1) // self.shard_actions):
+            self._open_shard(self.action_shards, "r+")
+        # A reopened store always starts a new trajectory
+        self.last_done = True
+
+    def _open_shard(self, shards: list, mode: str) -> None:
+        """Map the next record shard (shards is self.shards) or action shard (self.action_shards)."""
+        if shards is self.shards:
+            name, dtype, length = "shard", RECORD_DTYPE, self.shard_records
+        else:
+            name, dtype, length = "actions", ACTION_DTYPE, self.shard_actions
+        path = os.path.join(self.directory, f"{name}_{len(shards):05d}.bin")
+        shards.append(np.memmap(path, dtype=dtype, mode=mode, shape=(length,)))
+
+    def _record(self, index: int):
+        shard, offset = divmod(index, self.shard_records)
+        return self.shards[shard][offset]
+
+    def _append_actions(self, legal_actions) -> int:
+        """Append the legal actions to the action shards and return the offset of the first."""
+        start, written = self.legal_end, 0
+        while written < len(legal_actions):
+            shard, offset = divmod(self.legal_end, self.shard_actions)
+            if shard == len(self.action_shards):
+                self._open_shard(self.action_shards, "w+")
+            count = min(len(legal_actions) - written, self.shard_actions - offset)
+            self.action_shards[shard][offset:offset + count] = legal_actions[written:written + count]
+            written += count
+            self.legal_end += count
+        return start
+
+    def _append(self, board, white_to_move, legal_actions) -> int:
+        index = self.records
+        if index // self.shard_records == len(self.shards):
+            self._open_shard(self.shards, "w+")
+        record = self._record(index)
+        record["board"] = board
+        record["white_to_move"] = white_to_move
+        if legal_actions is None:
+            record["legal_count"] = ALL_ACTIONS
+        else:
+            record["legal_offset"] = self._append_actions(legal_actions)
+            record["legal_count"] = len(legal_actions)
+        record["valid"] = 0
+        self.records += 1
+        return index
+
+    def push(self, state, action, reward, next_state, done, next_action_mask=None) -> None:
+        next_legal_actions = None if next_action_mask is None else np.flatnonzero(next_action_mask)
+        self.push_codes(*observation_to_codes(state), action, reward, *observation_to_codes(next_state), done,
+                        next_legal_actions)
+
+    def push_codes(self, board, white_to_move, action, reward, next_board, next_white_to_move, done,
+                   next_legal_actions=None) -> None:
+        """push, with both states given as piece codes and side to move, and the legal actions as indices."""
+        index = self.records - 1
+        last = self._record(index) if self.records else None
+        if self.last_done or not (np.array_equal(last["board"], board) and last["white_to_move"] == white_to_move):
+            index = self._append(board, white_to_move, None)
+        record = self._record(index)
+        record["action"] = action
+        record["reward"] = reward
+        record["done"] = done
+        self._append(next_board, next_white_to_move, next_legal_actions)
+        record["valid"] = 1
+        self.count += 1
+        self.last_done = done
+
+    @staticmethod
+    def _gather(shards: list, shard_length: int, dtype: np.dtype, indices: np.ndarray) -> np.ndarray:
+        """Entries at the given global indices, read straight from the mapped shards."""
+        entries = np.empty(len(indices), dtype=dtype)
+        shard_indices, offsets = np.divmod(indices, shard_length)
+        for shard in np.unique(shard_indices):
+            in_shard = shard_indices == shard
+            entries[in_shard] = shards[shard][offsets[in_shard]]
+        return entries
+
+    def _legal_action_masks(self, records: np.ndarray) -> np.ndarray:
+        counts = records["legal_count"]
+        lengths = np.maximum(counts, 0).astype(np.int64)
+        # Offset of each listed action: its record's offset plus its place in the list
+        starts = np.repeat(records["legal_offset"] - (np.cumsum(lengths) - lengths), lengths)
+        actions = self._gather(self.action_shards, self.shard_actions, ACTION_DTYPE, starts + np.arange(lengths.sum()))
+        return legal_action_masks(actions, counts)
+
+    def sample(self, batch_size: int):
+        """Random transitions, in the same format as agent.ReplayBuffer.sample."""
+        records = np.empty(0, dtype=RECORD_DTYPE)
+        indices = np.empty(0, dtype=np.int64)
+        while len(indices) < batch_size:
+            candidates = np.random.randint(0, self.records, size=2 * batch_size)
+            candidate_records = self._gather(self.shards, self.shard_records, RECORD_DTYPE, candidates)
+            valid = candidate_records["valid"].astype(bool)
+            indices = np.concatenate([indices, candidates[valid]])
+            records = np.concatenate([records, candidate_records[valid]])
+        indices, records = indices[:batch_size], records[:batch_size]
+        next_records = self._gather(self.shards, self.shard_records, RECORD_DTYPE, indices + 1)
+        return (codes_to_observations(records["board"], records["white_to_move"]),
+                records["action"].astype(np.int64), records["reward"].copy(),
+                codes_to_observations(next_records["board"], next_records["white_to_move"]),
+                records["done"].astype(np.float32), self._legal_action_masks(next_records))
+
+    def flush(self) -> None:
+        """Write the mapped pages and the record counts to disk."""
+        for shard in self.shards + self.action_shards:
+            shard.flush()
+        meta = {"version": FORMAT_VERSION, "shard_records": self.shard_records,
+                "records": self.records, "legal_actions": self.legal_end, "transitions": self.count}
+        meta_path = os.path.join(self.directory, META_FILE)
+        with open(meta_path + ".tmp", "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def close(self) -> None:
+        self.flush()
+        self.shards = []
+        self.action_shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,84 @@
+"""
+Statistics of one search, returned by algorithm_utils.search_best_move and
+passed to the on_iteration / on_search callbacks. JsonLogSink is a callback
+that appends them to a file, one JSON object per line:
+
+    with JsonLogSink("search_log.jsonl") as sink:
+        move, stats = algorithm_utils.search_best_move(gs, valid_moves, time_limit=5, on_search=sink)
+    print(stats.nps, stats.principal_variation)
+"""
+import json
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+
+@dataclass
+class SearchStats:
+    source: str = "search"  # "search", "book" or "tablebase"
+    depth: int = 0  # last completed iteration
+    score: Optional[int] = None  # of the last completed iteration, positive favors white
+    nodes: int = 0
+    quiescence_nodes: int = 0
+    # Nodes searched by each iteration, the last one may not have finished
+    depth_nodes: Dict[int, int] = field(default_factory=dict)
+    expanded_nodes: int = 0  # main search nodes whose moves were searched
+    cutoffs: int = 0  # beta cutoffs among them
+    first_move_cutoffs: int = 0  # cutoffs by the first move searched
+    tt_probes: int = 0
+    tt_hits: int = 0
+    elapsed: float = 0.0  # seconds
+    principal_variation: List[str] = field(default_factory=list)  # coordinate notation
+    workers: int = 1
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def cutoff_rate(self) -> float:
+        return self.cutoffs / self.expanded_nodes if self.expanded_nodes else 0.0
+
+    @property
+    def first_move_cutoff_rate(self) -> float:
+        """Share of cutoffs found on the first move, a measure of move ordering."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def tt_hit_rate(self) -> Optional[float]:
+        return self.tt_hits / self.tt_probes if self.tt_probes else None
+
+    def to_dict(self) -> dict:
+        stats = asdict(self)
+        stats.update(nps=self.nps, cutoff_rate=self.cutoff_rate, first_move_cutoff_rate=self.first_move_cutoff_rate,
+                     tt_hit_rate=self.tt_hit_rate)
+        return stats
+
+    def summary(self) -> str:
+        if self.source != "search":
+            return f"{self.source.capitalize()} move: {' '.join(self.principal_variation[:1])}"
+        tt_hits = f", tt hits: {self.tt_hit_rate:.0%}" if self.tt_hit_rate is not None else ""
+        workers = f", workers: {self.workers}" if self.workers > 1 else ""
+        return (f"Elapsed time: {self.elapsed:.2f} sec, depth: {self.depth}, nodes: {self.nodes} "
+                f"(quiescence: {self.quiescence_nodes}), nps: {self.nps:.0f}, cutoffs: {self.cutoff_rate:.0%} "
+                f"(first move: {self.first_move_cutoff_rate:.0%}){tt_hits}{workers}, "
+                f"pv: {' '.join(self.principal_variation)}")
+
+
+class JsonLogSink:
+    """Callback writing every SearchStats it is called with as a line of JSON to path (appended)."""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, stats: SearchStats) -> None:
+        self._file.write(json.dumps(stats.to_dict()) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
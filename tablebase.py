@@ -0,0 +1,319 @@
+"""
+Endgame tablebases for small piece sets (KQK, KRK, KPK, ...), generated by
+retrograde analysis over the moves BitboardGameState generates.
+
+A table is named after its material, white's pieces first: "KRK" is king and
+rook against a lone king, "KQKR" queen against rook. It stores one byte per
+position from the point of view of the side to move:
+
+    0        draw (or an illegal position)
+    n > 0    mate in n - 1 plies, won for the side to move if n - 1 is odd
+             and lost if it is even (0 plies: checkmated)
+
+Positions are indexed by the white king square after symmetry reduction (the
+a1-d1-d4 triangle without pawns, the a-d files with pawns), then every other
+piece square and the side to move. Positions with the colors reversed are
+probed through the table of the mirrored material.
+
+    python tablebase.py KQK KRK KPK          # build into tablebases/
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from bitboard_engine import BitboardGameState
+from evaluation import pieceScore
+
+TABLEBASE_DIR = "tablebases"
+PIECE_ORDER = "QRBNp"  # order of the non-king pieces within a table name and index
+
+# Probe results, from the point of view of the side to move
+WIN, DRAW, LOSS = 1, 0, -1
+
+
+def _transform(sq: int, mirror_file: bool, flip_rank: bool, transpose: bool) -> int:
+    r, c = divmod(sq, 8)
+    if mirror_file:
+        c = 7 - c
+    if flip_rank:
+        r = 7 - r
+    if transpose:  # reflect in the a1-h8 diagonal
+        r, c = 7 - c, 7 - r
+    return r * 8 + c
+
+
+def _symmetry_tables(has_pawns: bool):
+    """Per white king square: the square map that brings it into the canonical region, and its index there."""
+    maps = []
+    king_index = {}
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        mirror_file = c > 3
+        flip_rank = not has_pawns and r < 4
+        mapped = _transform(sq, mirror_file, flip_rank, False)
+        mr, mc = divmod(mapped, 8)
+        transpose = not has_pawns and 7 - mr > mc  # rank above file: move below the diagonal
+        maps.append(tuple(_transform(s, mirror_file, flip_rank, transpose) for s in range(64)))
+    for sq in range(64):
+        canonical = maps[sq][sq]
+        if canonical not in king_index:
+            king_index[canonical] = len(king_index)
+    return maps, king_index
+
+
+_SYMMETRY = {has_pawns: _symmetry_tables(has_pawns) for has_pawns in (False, True)}
+# Vertical flip used to probe positions with the colors reversed
+_FLIP = tuple((7 - sq // 8) * 8 + sq % 8 for sq in range(64))
+
+
+def _sort_kinds(kinds) -> List[str]:
+    return sorted(kinds, key=PIECE_ORDER.index)
+
+
+def table_name(white_kinds, black_kinds) -> str:
+    return "K" + "".join(_sort_kinds(white_kinds)).upper() + "K" + "".join(_sort_kinds(black_kinds)).upper()
+
+
+def _parse_name(name: str) -> Tuple[List[str], List[str]]:
+    white, black = name.upper()[1:].split("K")
+    to_kind = lambda letter: "p" if letter == "P" else letter
+    return _sort_kinds(map(to_kind, white)), _sort_kinds(map(to_kind, black))
+
+
+class Tablebase:
+    """One material configuration and its values (None while it is being generated)."""
+    def __init__(self, name: str, values: Optional[bytes] = None):
+        self.white_kinds, self.black_kinds = _parse_name(name)
+        self.name = table_name(self.white_kinds, self.black_kinds)
+        self.pieces = ["wK", "bK"] + ["w" + kind for kind in self.white_kinds] + ["b" + kind for kind in self.black_kinds]
+        self.has_pawns = "p" in self.white_kinds + self.black_kinds
+        self.king_maps, self.king_index = _SYMMETRY[self.has_pawns]
+        self.size = len(self.king_index) * 64 ** (len(self.pieces) - 1) * 2
+        self.values = values
+        self.material = sum(pieceScore[kind] for kind in self.white_kinds + self.black_kinds)
+
+    def index(self, squares: List[int], white_to_move: bool) -> int:
+        """Index of the position with the pieces on squares (in self.pieces order)."""
+        square_map = self.king_maps[squares[0]]
+        index = self.king_index[square_map[squares[0]]]
+        for sq in squares[1:]:
+            index = index * 64 + square_map[sq]
+        return index * 2 + (not white_to_move)
+
+    def decode(self, index: int) -> Tuple[List[int], bool]:
+        white_to_move = index % 2 == 0
+        index //= 2
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        king_squares = list(self.king_index)
+        return [king_squares[index]] + squares[::-1], white_to_move
+
+
+def _result(value: int) -> Tuple[int, int]:
+    if value == 0:
+        return DRAW, 0
+    plies = value - 1
+    return (WIN if plies % 2 else LOSS), plies
+
+
+def _piece_squares(gs) -> Dict[str, List[int]]:
+    if isinstance(gs, BitboardGameState):
+        squares = {}
+        for piece, bits in gs.pieces.items():
+            while bits:
+                lsb = bits & -bits
+                bits ^= lsb
+                squares.setdefault(piece, []).append(lsb.bit_length() - 1)
+        return squares
+    board = gs.board
+    rows = board.tolist() if hasattr(board, "tolist") else board
+    squares = {}
+    for r in range(8):
+        for c, piece in enumerate(rows[r]):
+            if piece != "--":
+                squares.setdefault(piece, []).append(r * 8 + c)
+    return squares
+
+
+class Tablebases:
+    """The tables loaded from a directory, probed by the search."""
+    def __init__(self, tables: Optional[Dict[str, Tablebase]] = None, directory: Optional[str] = None):
+        self.tables = tables or {}
+        self.directory = directory  # where the tables were loaded from, if they were
+        self.max_material = max((table.material for table in self.tables.values()), default=0)
+
+    @classmethod
+    def load(cls, directory: str = TABLEBASE_DIR) -> "Tablebases":
+        tables = {}
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(".bin"):
+                with open(os.path.join(directory, file_name), "rb") as table_file:
+                    table = Tablebase(file_name[:-4], table_file.read())
+                if len(table.values) == table.size:
+                    tables[table.name] = table
+        return cls(tables, directory)
+
+    def add(self, table: Tablebase) -> None:
+        self.tables[table.name] = table
+        self.max_material = max(self.max_material, table.material)
+
+    def probe(self, gs) -> Optional[Tuple[int, int]]:
+        """
+        (WIN / DRAW / LOSS for the side to move, plies to mate) if the position
+        is covered by a loaded table, otherwise None.
+        """
+        if gs.material['w'] + gs.material['b'] > self.max_material:
+            return None
+        return self.probe_squares(_piece_squares(gs), gs.white_to_move)
+
+    def probe_squares(self, squares: Dict[str, List[int]], white_to_move: bool) -> Optional[Tuple[int, int]]:
+        kinds = {color: [piece[1] for piece, found in squares.items() if piece[0] == color and piece[1] != "K"
+                         for _ in found] for color in "wb"}
+        if not kinds['w'] and not kinds['b']:
+            return DRAW, 0  # bare kings
+        name = table_name(kinds['w'], kinds['b'])
+        table = self.tables.get(name)
+        if table is not None:
+            ordered = _ordered_squares(table.pieces, squares)
+            return _result(table.values[table.index(ordered, white_to_move)])
+        table = self.tables.get(table_name(kinds['b'], kinds['w']))
+        if table is not None:  # the same ending with the colors reversed
+            swapped = {("w" if piece[0] == "b" else "b") + piece[1]: [_FLIP[sq] for sq in found]
+                       for piece, found in squares.items()}
+            ordered = _ordered_squares(table.pieces, swapped)
+            return _result(table.values[table.index(ordered, not white_to_move)])
+        return None
+
+    def best_move(self, gs, valid_moves: list):
+        """
+        The move that wins fastest, holds the draw, or loses slowest according to
+        the tables, or None if the position or any reply is not covered.
+        """
+        if not valid_moves or self.probe(gs) is None:
+            return None
+        best_move, best_key = None, None
+        for move in valid_moves:
+            gs.make_move(move)
+            result = self.probe(gs)
+            gs.undo_move()
+            if result is None:
+                return None
+            outcome, plies = result
+            # Rank from the mover's point of view: the reply's loss is our win
+            key = (-outcome, -plies if outcome == LOSS else plies)
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+        return best_move
+
+
+def _ordered_squares(pieces: List[str], squares: Dict[str, List[int]]) -> List[int]:
+    """The squares of the pieces in table order."""
+    remaining = {piece: list(found) for piece, found in squares.items()}
+    return [remaining[piece].pop() for piece in pieces]
+
+
+def generate(name: str, tablebases: Tablebases) -> Tablebase:
+    """
+    Build the table for name. Positions that leave the table (captures and
+    promotions) are looked up in tablebases, which must already hold those tables.
+    """
+    table = Tablebase(name)
+    size = table.size
+    legal = np.zeros(size, dtype=bool)
+    plies = np.full(size, -1, dtype=np.int16)  # -1: not (yet) known to be won or lost
+    sources, targets = [], []
+    exits = {}  # node of each result reached outside the table, after the table's own nodes
+    gs = BitboardGameState()
+    for index in range(size):
+        squares, white_to_move = table.decode(index)
+        if len(set(squares)) != len(squares):
+            continue
+        if any(piece[1] == "p" and sq // 8 in (0, 7) for piece, sq in zip(table.pieces, squares)):
+            continue
+        gs.board = [["--"] * 8 for _ in range(8)]
+        for piece, sq in zip(table.pieces, squares):
+            gs.board[sq // 8][sq % 8] = piece
+        gs.white_to_move = white_to_move
+        gs.castle_rights = 0
+        gs.enpassant_square = -1
+        gs._load_bitboards()
+        king_row, king_col = gs.black_king_loc if white_to_move else gs.white_king_loc
+        if gs.is_square_attacked(king_row, king_col, "w" if white_to_move else "b"):
+            continue  # the side that just moved is in check
+        legal[index] = True
+        moves = gs.get_valid_moves()
+        if not moves and gs.in_check:
+            plies[index] = 0
+        for move in moves:
+            gs.make_move(move)
+            child = _piece_squares(gs)
+            child_kinds = sorted(piece for piece, found in child.items() for _ in found)
+            if child_kinds == sorted(table.pieces):
+                target = table.index(_ordered_squares(table.pieces, child), gs.white_to_move)
+            else:
+                result = tablebases.probe_squares(child, gs.white_to_move)
+                if result is None:
+                    raise ValueError(f"{name} needs the tables its captures and promotions lead to")
+                target = exits.setdefault(result, size + len(exits))
+            gs.undo_move()
+            sources.append(index)
+            targets.append(target)
+
+    # Retrograde analysis, one ply at a time: a position is won in n plies if a move
+    # reaches a position lost in n - 1, and lost in n if every move reaches a won
+    # position and the longest of those wins takes n - 1 plies
+    exit_plies = [plies if outcome != DRAW else -1 for (outcome, plies), _ in sorted(exits.items(), key=lambda e: e[1])]
+    values = np.concatenate([plies, np.array(exit_plies, dtype=np.int16)])
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+    move_counts = np.bincount(sources, minlength=size)
+    last_change = max(exit_plies + [0])
+    n = 0
+    while n <= last_change + 2:
+        n += 1
+        target_plies = values[targets]
+        open_positions = legal & (values[:size] == -1)
+        if n % 2:
+            found = np.zeros(size, dtype=bool)
+            found[sources[target_plies == n - 1]] = True
+        else:
+            won = (target_plies >= 0) & (target_plies % 2 == 1)
+            won_counts = np.bincount(sources, weights=won, minlength=size)
+            longest = np.full(size, -1, dtype=np.int16)
+            np.maximum.at(longest, sources, target_plies)
+            found = (move_counts > 0) & (won_counts == move_counts) & (longest == n - 1)
+        found &= open_positions
+        if found.any():
+            values[:size][found] = n
+            last_change = n
+    if values[:size].max() >= 255:
+        raise ValueError(f"{name}: mates too long to store in one byte")
+    table.values = np.where(values[:size] >= 0, values[:size] + 1, 0).astype(np.uint8).tobytes()
+    return table
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases by retrograde analysis.")
+    parser.add_argument("tables", nargs="+", help="material to build, in dependency order (e.g. KQK KPK)")
+    parser.add_argument("--directory", default=TABLEBASE_DIR)
+    args = parser.parse_args(argv)
+    os.makedirs(args.directory, exist_ok=True)
+    tablebases = Tablebases.load(args.directory)
+    for name in args.tables:
+        start_time = time.time()
+        table = generate(name, tablebases)
+        with open(os.path.join(args.directory, table.name + ".bin"), "wb") as table_file:
+            table_file.write(table.values)
+        tablebases.add(table)
+        outcomes = [_result(value)[0] for value in table.values]
+        print(f"{table.name}: {table.size} positions, {outcomes.count(WIN)} won, {outcomes.count(LOSS)} lost, "
+              f"longest mate {max(table.values) - 1} plies, {time.time() - start_time:.1f} sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
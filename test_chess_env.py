@@ -0,0 +1,35 @@
+from chess_env import ChessEnv, BatchChessEnv
+
+
+def play(env, moves):
+    """Step env through moves in coordinate notation, return the (reward, done) of each."""
+    results = []
+    for text in moves:
+        action = next(action for action, move in env.valid_moves.items() if move.get_chess_notation() == text)
+        _, reward, done, _ = env.step(action)
+        results.append((reward, done))
+    return results
+
+
+def test_mate_reward_is_dense_score_plus_bonus():
+    env = ChessEnv()
+    results = play(env, ["f2f3", "e7e5", "g2g4", "d8h4"])
+    assert [done for _, done in results] == [False, False, False, True]
+    # The mating queen move changes the score by a few points and the mate adds
+    # the terminal bonus of 1, nothing near the check_mate search score
+    reward = results[-1][0]
+    assert abs(reward) < 10
+
+
+def test_batch_env_rewards_match_chess_env():
+    # Fool's mate with both move generators, ending in a mate and the automatic reset
+    moves = ["f2f3", "e7e5", "g2g4", "d8h4"]
+    expected = play(ChessEnv(), moves)
+    for use_bitboard in (False, True):
+        env = BatchChessEnv(1, use_bitboard=use_bitboard)
+        results = []
+        for text in moves:
+            action = next(action for action, move in env.valid_moves[0].items() if move.get_chess_notation() == text)
+            _, rewards, dones, _ = env.step([action])
+            results.append((rewards[0], dones[0]))
+        assert results == expected
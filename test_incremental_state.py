@@ -0,0 +1,75 @@
+import random
+from collections import Counter
+import pytest
+import evaluation
+import zobrist
+from perft import BACKENDS, PERFT_SUITE, new_game_state
+
+GAMES = 3  # random games per position
+PLIES = 30  # moves of each game, all taken back afterwards
+# Positions with an en passant capture on the first move, besides the castling and promotions of the suite
+POSITIONS = [fen for _, fen, _ in PERFT_SUITE] + [
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+    "8/8/8/8/1pP5/8/8/K1k5 b - c3 0 1",
+]
+
+
+def special_kinds(move):
+    return [kind for kind in ("is_pawn_promotion", "is_enpassant_move", "is_castle_move") if getattr(move, kind)]
+
+
+def random_walk(gs, rng, check):
+    """
+    Play PLIES random moves on gs, preferring promotions, en passant and castling
+    half of the time, then take them all back, calling check(gs) after every
+    move and undo. Returns the kinds of special moves played.
+    """
+    played = Counter()
+    moves = 0
+    for _ in range(PLIES):
+        valid_moves = gs.get_valid_moves()
+        if not valid_moves:
+            break
+        special = [move for move in valid_moves if special_kinds(move)]
+        move = rng.choice(special if special and rng.random() < 0.5 else valid_moves)
+        played.update(special_kinds(move))
+        gs.make_move(move)
+        moves += 1
+        check(gs)
+    for _ in range(moves):
+        gs.undo_move()
+        check(gs)
+    return played
+
+
+def play_games(backend, check):
+    rng = random.Random(backend)
+    played = Counter()
+    for fen in POSITIONS:
+        gs = new_game_state(fen, backend)
+        for _ in range(GAMES):
+            played += random_walk(gs, rng, check)
+    return played
+
+
+def check_zobrist_key(gs):
+    rights = gs.current_castling_right
+    castle_rights = zobrist.castle_index(rights.wks, rights.wqs, rights.bks, rights.bqs)
+    enpassant_col = gs.enpassant_possible[1] if gs.enpassant_possible else -1
+    assert gs.zobrist_key == zobrist.hash_position(gs.board, gs.white_to_move, castle_rights, enpassant_col)
+
+
+def check_scores(gs):
+    assert (gs.material, gs.positional) == evaluation.material_and_position(gs.board)
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_incremental_zobrist_key_matches_full_hash(backend):
+    played = play_games(backend, check_zobrist_key)
+    assert set(played) == {"is_pawn_promotion", "is_enpassant_move", "is_castle_move"}
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_incremental_scores_match_full_evaluation(backend):
+    played = play_games(backend, check_scores)
+    assert set(played) == {"is_pawn_promotion", "is_enpassant_move", "is_castle_move"}
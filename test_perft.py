@@ -0,0 +1,9 @@
+import pytest
+from perft import BACKENDS, run_suite
+
+SUITE_DEPTH = 4  # deeper counts are checked with python perft.py --suite --depth N
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_perft_suite(backend):
+    assert run_suite(backend, SUITE_DEPTH, verbose=False) == []
@@ -0,0 +1,120 @@
+import numpy as np
+from agent import ReplayBuffer
+from chess_env import ChessEnv
+from replay_store import ReplayStore
+
+CAPACITY = 37
+GAMES = 6
+MAX_PLIES = 30  # longer games are cut off without done, like the self-play move limit
+
+
+FOOLS_MATE = ["f2f3", "e7e5", "g2g4", "d8h4"]
+
+
+def play_game(actions):
+    """
+    A game as a list of (state, action, reward, next_state, done, next_action_mask),
+    with each move taken from actions, a generator sent the env.
+    """
+    env = ChessEnv(use_bitboard=True)
+    state = env.reset().copy()
+    transitions = []
+    for action in actions(env):
+        next_state, reward, done, info = env.step(action)
+        transitions.append((state, action, reward, next_state.copy(), done, info["action_mask"].copy()))
+        state = next_state.copy()
+        if done:
+            break
+    return transitions
+
+
+def play_games(games, seed=0):
+    """Random games, and the fool's mate as the third so one game ends in done."""
+    rng = np.random.default_rng(seed)
+
+    def random_moves(env):
+        for _ in range(rng.integers(10, MAX_PLIES)):
+            yield int(rng.choice(np.flatnonzero(env.action_mask)))
+
+    def fools_mate(env):
+        for text in FOOLS_MATE:
+            yield next(action for action, move in env.valid_moves.items() if move.get_chess_notation() == text)
+
+    played = [play_game(random_moves) for _ in range(games - 1)]
+    played.insert(2, play_game(fools_mate))
+    return played
+
+
+def key(state, action):
+    return state.tobytes(), int(action)
+
+
+def check_samples(replay, expected, batch_size=1000):
+    """Every sampled transition is one of expected, a dict from key to transition, and all of them come up."""
+    seen = set()
+    for state, action, reward, next_state, done, mask in zip(*replay.sample(batch_size)):
+        transition = expected[key(state, action)]
+        np.testing.assert_array_equal(next_state, transition[3])
+        assert reward == np.float32(transition[2])
+        assert done == transition[4]
+        np.testing.assert_array_equal(mask, transition[5])
+        seen.add(key(state, action))
+    assert seen == set(expected)
+
+
+def test_replay_buffer_samples_match_pushed_transitions():
+    np.random.seed(0)
+    games = play_games(GAMES)
+    buffer = ReplayBuffer(capacity=CAPACITY)
+    # Consecutive transitions share their state, so a game of n moves takes n + 1 slots
+    for transition in games[0]:
+        buffer.push(*transition)
+    assert (buffer.size, len(buffer)) == (len(games[0]) + 1, len(games[0]))
+    # The next game starts past the last state of the previous one, which no transition starts from
+    buffer.push(*games[1][0])
+    assert buffer.size == len(games[0]) + 3
+    assert not buffer.valid[len(games[0])]
+    for transition in games[1][1:]:
+        buffer.push(*transition)
+    for game in games[2:]:
+        for transition in game:
+            buffer.push(*transition)
+    # Only the transitions whose slot and next slot are among the last CAPACITY written remain
+    slots_written = sum(len(game) + 1 for game in games)
+    assert slots_written > 2 * CAPACITY
+    expected = {}
+    first_slot = 0
+    for game in games:
+        for i, transition in enumerate(game):
+            if first_slot + i >= slots_written - CAPACITY:
+                expected[key(transition[0], transition[1])] = transition
+        first_slot += len(game) + 1
+    assert len(buffer) == len(expected)
+    check_samples(buffer, expected)
+
+
+def test_replay_buffer_without_masks_allows_every_action():
+    (state, action, reward, next_state, done, _), = play_games(1)[0][:1]
+    buffer = ReplayBuffer(capacity=4)
+    buffer.push(state, action, reward, next_state, done)
+    assert buffer.sample(2)[5].all()
+
+
+def test_replay_store_reopens_and_keeps_sampling(tmp_path):
+    np.random.seed(0)
+    games = play_games(GAMES)
+    # Small shards, so records and legal-action lists span several files
+    with ReplayStore(str(tmp_path), shard_records=16) as store:
+        for game in games[:3]:
+            for transition in game:
+                store.push(*transition)
+        first_run = len(store)
+    # The shard size is taken from the directory, and pushing goes on from the last record
+    with ReplayStore(str(tmp_path), shard_records=1 << 10) as store:
+        assert (store.shard_records, len(store)) == (16, first_run)
+        for game in games[3:]:
+            for transition in game:
+                store.push(*transition)
+        assert len(store) == sum(len(game) for game in games)
+        assert len(store.shards) > 1 and len(store.action_shards) > 1
+        check_samples(store, {key(transition[0], transition[1]): transition for game in games for transition in game})
@@ -0,0 +1,296 @@
+"""
+Headless matches between two agents, played on a pool of worker processes.
+Agents are given as specs:
+
+    random                          algorithm_utils.find_random_move
+    minimax                         Searcher at MAX_DEPTH, like find_best_move_minimax
+    minimax:depth=2,nodes=5000      any of depth, nodes, time (seconds), randomize
+    dqn:chess_dqn_model.pth         greedy legal move of a trained ChessDQN
+
+    python tournament.py minimax:depth=2 random --games 1000 --output results.jsonl
+
+Colors alternate and every pair of games starts from the same random opening,
+so each agent plays both sides of it. Games end in mate, stalemate, threefold
+repetition or a draw at the move limit. Each finished game is appended to the
+output file as a line of JSON, and the score of the first agent is reported as
+win/draw/loss and an Elo difference with its confidence interval.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import numpy as np
+from algorithm_utils import Searcher, find_random_move
+from chess_engine import GameState, Move, PIECE_CODES, START_FEN
+from chess_env import codes_to_observations
+from opening_book import OpeningBook
+from perft import BACKENDS, new_game_state
+from tablebase import Tablebases
+
+MAX_GAME_MOVES = 200  # games still running after this many moves per side are drawn
+OPENING_PLIES = 4  # random moves played before the agents take over
+REPORT_EVERY = 100  # games between progress reports
+Z_95 = 1.959964  # two-sided 95% normal quantile
+# Half a win and half a loss added to the interval, so all-win or all-loss matches keep a finite bound
+PRIOR_GAMES = 0.5
+
+
+class RandomAgent:
+    def new_game(self) -> None:
+        pass
+
+    def select_move(self, gs: GameState, valid_moves: list) -> Move:
+        return find_random_move(valid_moves)
+
+
+class MinimaxAgent:
+    """Searcher with find_best_move_minimax's limits, without printing every search."""
+    def __init__(self, depth: int = None, nodes: int = None, time: float = None, randomize: bool = False,
+                 opening_book: Optional[OpeningBook] = None, tablebases: Optional[Tablebases] = None):
+        self.max_depth = depth
+        self.max_nodes = nodes
+        self.time_limit = time
+        self.randomize = randomize
+        self.opening_book = opening_book
+        self.tablebases = tablebases
+        self.searcher = None
+
+    def new_game(self) -> None:
+        """Start from empty tables, so a game does not depend on the ones the worker played before."""
+        self.searcher = Searcher(self.opening_book, self.tablebases)
+
+    def select_move(self, gs: GameState, valid_moves: list) -> Move:
+        return self.searcher.search(gs, valid_moves, self.time_limit, self.max_nodes, self.max_depth,
+                                    self.randomize).move
+
+
+class DQNPlayer:
+    """Plays the legal move with the highest Q-value of a saved ChessDQN."""
+    def __init__(self, path: str):
+        import torch
+        from agent import ChessDQN
+        torch.set_num_threads(1)  # one core per worker process
+        self.net = ChessDQN()
+        self.net.load_state_dict(torch.load(path, map_location="cpu"))
+        self.net.eval()
+
+    def new_game(self) -> None:
+        pass
+
+    def select_move(self, gs: GameState, valid_moves: list) -> Move:
+        from agent import masked_greedy_actions
+        codes = np.array([[PIECE_CODES[square] for row in gs.board for square in row]], dtype=np.uint8)
+        moves = {move.start_sq * 64 + move.end_sq: move for move in valid_moves}
+        mask = np.zeros((1, 4096), dtype=bool)
+        mask[0, list(moves)] = True
+        action = masked_greedy_actions(self.net, codes_to_observations(codes, [gs.white_to_move]), mask)[0]
+        return moves[int(action)]
+
+
+def make_agent(spec: str, opening_book: Optional[OpeningBook] = None, tablebases: Optional[Tablebases] = None):
+    """Build an agent from its spec, see the module docstring."""
+    kind, _, options = spec.partition(":")
+    if kind == "random":
+        return RandomAgent()
+    if kind == "dqn":
+        return DQNPlayer(options or "chess_dqn_model.pth")
+    if kind == "minimax":
+        limits = {}
+        for option in filter(None, options.split(",")):
+            name, _, value = option.partition("=")
+            if name in ("depth", "nodes"):
+                limits[name] = int(value)
+            elif name == "time":
+                limits[name] = float(value)
+            elif name == "randomize":
+                limits[name] = value.lower() not in ("0", "false", "no")
+            else:
+                raise ValueError(f"Unknown minimax option {name!r} in {spec!r}")
+        return MinimaxAgent(opening_book=opening_book, tablebases=tablebases, **limits)
+    raise ValueError(f"Unknown agent {spec!r}, expected random, minimax[:options] or dqn[:path]")
+
+
+# Worker process state, set up by _init_worker
+_agents = None
+_max_moves = MAX_GAME_MOVES
+_opening_plies = OPENING_PLIES
+_seed = 0
+_backend = "bitboard"
+
+
+def _init_worker(specs: Tuple[str, str], max_moves: int, opening_plies: int, seed: int,
+                 book_path: Optional[str], tablebase_dir: Optional[str], backend: str) -> None:
+    global _agents, _max_moves, _opening_plies, _seed, _backend
+    opening_book = OpeningBook(book_path) if book_path else None
+    tables = Tablebases.load(tablebase_dir) if tablebase_dir else None
+    _agents = [make_agent(spec, opening_book, tables) for spec in specs]
+    _max_moves, _opening_plies, _seed, _backend = max_moves, opening_plies, seed, backend
+
+
+def play_game(white, black, max_moves: int = MAX_GAME_MOVES, opening_plies: int = 0,
+              rng: random.Random = None, backend: str = "bitboard") -> Tuple[float, str, list]:
+    """
+    Play one game and return (white's score: 1, 0.5 or 0, how it ended, moves in
+    coordinate notation). The first opening_plies moves are chosen by rng at random.
+    backend is a key of perft.BACKENDS. Call new_game on the agents before.
+    """
+    rng = rng or random.Random()
+    gs = new_game_state(START_FEN, backend)
+    seen = Counter([gs.zobrist_key])
+    moves = []
+    while True:
+        valid_moves = gs.get_valid_moves()
+        if gs.check_mate:
+            return (0.0 if gs.white_to_move else 1.0), "checkmate", moves
+        if gs.stale_mate:
+            return 0.5, "stalemate", moves
+        if seen[gs.zobrist_key] >= 3:
+            return 0.5, "repetition", moves
+        if len(moves) >= 2 * max_moves:
+            return 0.5, "move limit", moves
+        if len(moves) < opening_plies:
+            move = rng.choice(valid_moves)
+        else:
+            move = (white if gs.white_to_move else black).select_move(gs, valid_moves)
+        gs.make_move(move)
+        seen[gs.zobrist_key] += 1
+        moves.append(move.get_chess_notation())
+
+
+def _play_game(index: int) -> dict:
+    """Game index of the match in a worker: odd games swap colors and replay the previous opening."""
+    first_is_white = index % 2 == 0
+    # Seeding both the opening and the agents makes every game reproducible
+    random.seed(_seed * 1_000_003 + index)
+    rng = random.Random(_seed * 1_000_003 + index // 2)
+    white, black = _agents if first_is_white else _agents[::-1]
+    for agent in _agents:
+        agent.new_game()
+    start_time = time.time()
+    white_score, reason, moves = play_game(white, black, _max_moves, _opening_plies, rng, _backend)
+    return {"game": index, "first_is_white": first_is_white,
+            "result": {1.0: "1-0", 0.5: "1/2-1/2", 0.0: "0-1"}[white_score],
+            "score": white_score if first_is_white else 1.0 - white_score,
+            "reason": reason, "plies": len(moves), "elapsed": time.time() - start_time, "moves": moves}
+
+
+@dataclass
+class MatchResult:
+    """Score of the first agent against the second."""
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+    elapsed: float = 0.0  # seconds
+
+    def add(self, score: float) -> None:
+        if score == 1.0:
+            self.wins += 1
+        elif score == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    @property
+    def score(self) -> float:
+        return (self.wins + 0.5 * self.draws) / self.games if self.games else 0.5
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.elapsed if self.elapsed > 0 else 0.0
+
+    def elo(self) -> Tuple[float, float, float]:
+        """
+        Elo difference with its 95% confidence interval, (elo, low, high). The
+        interval is taken around the score with PRIOR_GAMES extra wins and
+        losses, so it stays finite on one side even when every game was won or lost.
+        """
+        if not self.games:
+            return 0.0, -math.inf, math.inf
+        wins, losses = self.wins + PRIOR_GAMES, self.losses + PRIOR_GAMES
+        games = self.games + 2 * PRIOR_GAMES
+        score = (wins + 0.5 * self.draws) / games
+        # Standard error of the mean score per game, from the trinomial win/draw/loss outcome
+        variance = (wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+        margin = Z_95 * math.sqrt(variance / games)
+        return _elo(self.score), _elo(score - margin), _elo(score + margin)
+
+    def summary(self) -> str:
+        elo, low, high = self.elo()
+        return (f"{self.games} games: +{self.wins} ={self.draws} -{self.losses}, score {self.score:.1%}, "
+                f"Elo {elo:+.0f} [{low:+.0f}, {high:+.0f}], {self.games_per_second:.2f} games/sec")
+
+
+def _elo(score: float) -> float:
+    if score <= 0.0:
+        return -math.inf
+    if score >= 1.0:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def run_match(first: str, second: str, games: int = 1000, workers: int = None, output: str = None,
+              max_moves: int = MAX_GAME_MOVES, opening_plies: int = OPENING_PLIES, seed: int = 0,
+              book_path: str = None, tablebase_dir: str = None, report_every: int = REPORT_EVERY,
+              backend: str = "bitboard") -> MatchResult:
+    """
+    Play games between the agent specs first and second on workers processes
+    (default: one per core) and return the first agent's MatchResult. Finished
+    games are appended to output as JSON lines as they come in.
+    """
+    result = MatchResult()
+    workers = workers or os.cpu_count() or 1
+    log = open(output, "a", encoding="utf-8") if output else None
+    start_time = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=((first, second), max_moves, opening_plies, seed,
+                                           book_path, tablebase_dir, backend)) as pool:
+            futures = [pool.submit(_play_game, index) for index in range(games)]
+            for future in as_completed(futures):
+                game = future.result()
+                result.add(game["score"])
+                result.elapsed = time.time() - start_time
+                if log is not None:
+                    game.update(first=first, second=second)
+                    log.write(json.dumps(game) + "\n")
+                    log.flush()
+                if report_every and result.games % report_every == 0 and result.games < games:
+                    print(result.summary(), flush=True)
+    finally:
+        if log is not None:
+            log.close()
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Play a match between two agents and report the first one's score.")
+    parser.add_argument("first", help="agent spec, e.g. minimax:depth=2")
+    parser.add_argument("second", help="agent spec, e.g. random")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="game processes (default: one per core)")
+    parser.add_argument("--output", default=None, help="append every game to this file as JSON lines")
+    parser.add_argument("--max-moves", type=int, default=MAX_GAME_MOVES, help="moves per side before a draw")
+    parser.add_argument("--opening-plies", type=int, default=OPENING_PLIES, help="random moves opening each game pair")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--book", default=None, help="opening book for the minimax agents")
+    parser.add_argument("--tablebases", default=None, help="tablebase directory for the minimax agents")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard", help="move generator")
+    args = parser.parse_args(argv)
+    result = run_match(args.first, args.second, args.games, args.workers, args.output, args.max_moves,
+                       args.opening_plies, args.seed, args.book, args.tablebases,
+                       backend=args.backend)
+    print(f"{args.first} vs {args.second}: {result.summary()}")
+
+
+if __name__ == "__main__":
+    main()
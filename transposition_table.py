@@ -0,0 +1,55 @@
+from typing import Optional, Tuple
+
+# Bound types stored with each score
+EXACT = 0
+LOWER_BOUND = 1  # search failed high, true score >= stored score
+UPPER_BOUND = 2  # search failed low, true score <= stored score
+
+# Entry layout: (key, depth, bound, score, best_move_id, generation)
+KEY, DEPTH, BOUND, SCORE, MOVE_ID, GENERATION = range(6)
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results indexed by Zobrist key.
+    Each slot holds one entry. A new entry replaces the old one if the old one
+    comes from a previous search or was searched to a depth no greater than the
+    new one, so deep results survive the flood of shallow ones within a search.
+    """
+    def __init__(self, size_log2: int = 18):
+        self.size = 1 << size_log2
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self) -> None:
+        """Age the table so entries from earlier searches become replaceable."""
+        self.generation += 1
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self) -> None:
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def probe(self, key: int) -> Optional[Tuple]:
+        """Return the entry stored for this position, or None."""
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[KEY] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def get(self, key: int) -> Optional[Tuple]:
+        """probe that does not count toward the hit rate, for reading the table after a search."""
+        entry = self.entries[key & self.mask]
+        return entry if entry is not None and entry[KEY] == key else None
+
+    def store(self, key: int, depth: int, bound: int, score: int, best_move_id: int) -> None:
+        slot = key & self.mask
+        old = self.entries[slot]
+        if old is None or old[GENERATION] != self.generation or depth >= old[DEPTH]:
+            self.entries[slot] = (key, depth, bound, score, best_move_id, self.generation)
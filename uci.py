@@ -0,0 +1,231 @@
+"""
+UCI front-end: plays the minimax search through the Universal Chess Interface
+on stdin/stdout, so the engine can run under a GUI or a match tool:
+
+    python uci.py [--book book.bin] [--tablebases tablebases] [--backend bitboard|array]
+
+Supported commands: uci, isready, ucinewgame, setoption name Threads value N,
+position startpos|fen <fen> [moves ...], go [wtime btime winc binc movestogo
+movetime depth nodes infinite], stop and quit. The search runs in a thread
+with a CancellationToken, so stop is answered within a few milliseconds with
+the best move of the last completed depth. Promotions are always to a queen.
+"""
+import argparse
+import math
+import os
+import sys
+import threading
+from typing import List, Optional
+from algorithm_utils import Searcher, CancellationToken, SearchResult, check_mate, TABLEBASE_WIN, MAX_ITERATIVE_DEPTH
+from chess_engine import GameState, Move, START_FEN
+from opening_book import OpeningBook
+from perft import BACKENDS, new_game_state
+from search_stats import SearchStats
+from tablebase import Tablebases
+
+ENGINE_NAME = "chess-game-AI"
+ENGINE_AUTHOR = "anhtr-nguyn"
+CENTIPAWNS = 10  # search scores are in tenths of a pawn
+MOVES_TO_GO = 30  # moves the remaining time is spread over when the GUI does not say
+MOVE_OVERHEAD = 0.05  # seconds kept back per move for communication
+MIN_MOVE_TIME = 0.01
+MAX_TABLEBASE_PLIES = 1000  # scores this close to TABLEBASE_WIN are tablebase wins
+GO_LIMITS = ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes")
+
+
+def uci_move(move: Move) -> str:
+    """Long algebraic notation, e.g. e2e4 or e7e8q."""
+    return move.get_chess_notation() + ("q" if move.is_pawn_promotion else "")
+
+
+def find_move(gs: GameState, text: str) -> Optional[Move]:
+    """The legal move of gs written as text in long algebraic notation (the promotion piece is ignored)."""
+    return next((move for move in gs.get_valid_moves() if move.get_chess_notation() == text[:4]), None)
+
+
+def allocate_time(time_left: float, increment: float = 0.0, moves_to_go: int = None) -> float:
+    """Seconds to search a move with time_left seconds on the clock."""
+    budget = time_left / (moves_to_go or MOVES_TO_GO) + 0.75 * increment
+    return max(min(budget, time_left / 2) - MOVE_OVERHEAD, MIN_MOVE_TIME)
+
+
+def uci_score(score: int, white_to_move: bool, pv_length: int) -> str:
+    """Search score (positive favors white) as a UCI score from the side to move."""
+    if not white_to_move:
+        score = -score
+    if abs(score) >= check_mate:
+        # Mate scores carry no distance, the principal variation leads to it
+        return f"mate {int(math.copysign((pv_length + 1) // 2, score))}"
+    if abs(score) > TABLEBASE_WIN - MAX_TABLEBASE_PLIES:
+        plies = TABLEBASE_WIN - abs(score)
+        return f"mate {int(math.copysign((plies + 1) // 2, score))}"
+    return f"cp {score * CENTIPAWNS}"
+
+
+class UCIEngine:
+    """Protocol state: the current position and the search running on it, if any."""
+    def __init__(self, searcher: Searcher, output=sys.stdout, backend: str = "bitboard"):
+        self.searcher = searcher
+        self.output = output
+        self.backend = backend  # a key of perft.BACKENDS
+        self.output_lock = threading.Lock()
+        self.gs = new_game_state(START_FEN, backend)
+        self.search_thread = None
+        self.token = None
+
+    def send(self, line: str) -> None:
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line: str) -> bool:
+        """Run one command, return False on quit. Unknown commands are ignored."""
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Threads type spin default {self.searcher.workers or 1} min 1 max {os.cpu_count() or 1}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop()
+            self.searcher.transposition_table.clear()
+            self.gs = new_game_state(START_FEN, self.backend)
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        return True
+
+    def set_option(self, args: List[str]) -> None:
+        if "name" not in args or "value" not in args:
+            return
+        name = " ".join(args[args.index("name") + 1:args.index("value")])
+        value = " ".join(args[args.index("value") + 1:])
+        if name.lower() == "threads":
+            self.stop()
+            self.searcher.workers = max(int(value), 1)
+
+    def set_position(self, args: List[str]) -> None:
+        moves_at = args.index("moves") if "moves" in args else len(args)
+        fen = " ".join(args[1:moves_at]) if args and args[0] == "fen" else START_FEN
+        gs = new_game_state(fen, self.backend)
+        for text in args[moves_at + 1:]:
+            move = find_move(gs, text)
+            if move is None:
+                self.send(f"info string illegal move {text}")
+                break
+            gs.make_move(move)
+        self.gs = gs
+
+    def go(self, args: List[str]) -> None:
+        options = {}
+        infinite = False
+        words = iter(args)
+        for word in words:
+            if word == "infinite":
+                infinite = True
+            elif word in GO_LIMITS:
+                options[word] = int(next(words, "0"))
+        time_limit = max_nodes = max_depth = None
+        if "movetime" in options:
+            time_limit = max(options["movetime"] / 1000 - MOVE_OVERHEAD, MIN_MOVE_TIME)
+        elif ("wtime" if self.gs.white_to_move else "btime") in options and not infinite:
+            side = "w" if self.gs.white_to_move else "b"
+            time_limit = allocate_time(options[side + "time"] / 1000, options.get(side + "inc", 0) / 1000,
+                                       options.get("movestogo"))
+        if "depth" in options:
+            max_depth = options["depth"]
+        if "nodes" in options:
+            max_nodes = options["nodes"]
+        if infinite and max_depth is None:
+            max_depth = MAX_ITERATIVE_DEPTH
+        self.token = CancellationToken()
+        self.search_thread = threading.Thread(target=self._search, name="uci-search", daemon=True,
+                                              args=(self.gs, time_limit, max_nodes, max_depth, infinite, self.token))
+        self.search_thread.start()
+
+    def stop(self) -> None:
+        """Cancel the running search and wait for it to send its bestmove."""
+        if self.search_thread is not None:
+            self.token.cancel()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def _search(self, gs: GameState, time_limit, max_nodes, max_depth, infinite: bool,
+                token: CancellationToken) -> None:
+        valid_moves = gs.get_valid_moves()
+        if valid_moves:
+            result = self.searcher.search(gs, valid_moves, time_limit, max_nodes, max_depth, cancel=token,
+                                          on_iteration=lambda stats: self.send_info(gs, stats))
+            # Completed depths have been reported already
+            if result.stats.source != "search" or result.stats.depth == 0:
+                self.send_info(gs, result.stats)
+        else:
+            result = SearchResult(None)
+        # Under go infinite the best move may only be sent once the GUI says stop
+        if infinite:
+            token.wait()
+        self.send(f"bestmove {uci_move(result.move) if result.move is not None else '0000'}")
+
+    def send_info(self, gs: GameState, stats: SearchStats) -> None:
+        if stats.source != "search":
+            self.send(f"info string {stats.source} move")
+        pv = self._uci_line(gs, stats.principal_variation)
+        score = f" score {uci_score(stats.score, gs.white_to_move, len(pv))}" if stats.score is not None else ""
+        self.send(f"info depth {stats.depth}{score} nodes {stats.nodes} nps {stats.nps:.0f} "
+                  f"time {stats.elapsed * 1000:.0f} pv {' '.join(pv)}".rstrip())
+
+    @staticmethod
+    def _uci_line(gs: GameState, notations: List[str]) -> List[str]:
+        """Replay the coordinate notation line on gs to mark its promotions."""
+        line = []
+        for text in notations:
+            move = find_move(gs, text)
+            if move is None:
+                break
+            line.append(uci_move(move))
+            gs.make_move(move)
+        for _ in line:
+            gs.undo_move()
+        return line
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the engine as a UCI engine on stdin/stdout.")
+    parser.add_argument("--book", default="book.bin", help="opening book, skipped if missing")
+    parser.add_argument("--tablebases", default="tablebases", help="tablebase directory, skipped if missing")
+    parser.add_argument("--threads", type=int, default=1, help="search processes")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard", help="move generator")
+    args = parser.parse_args(argv)
+    searcher = Searcher(OpeningBook(args.book) if os.path.isfile(args.book) else None,
+                        Tablebases.load(args.tablebases) if os.path.isdir(args.tablebases) else None,
+                        workers=args.threads)
+    engine = UCIEngine(searcher, backend=args.backend)
+    try:
+        # Read the unbuffered stream: the workers of a parallel search are forked while
+        # this thread waits for input and close sys.stdin on startup, which would
+        # block forever on the lock a buffered read holds
+        for line in iter(sys.stdin.buffer.raw.readline, b""):
+            if not engine.handle(line.decode()):
+                break
+    finally:
+        engine.stop()
+        searcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,29 @@ knightDirections = ((-2, -1), (-1, -2), (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2
 straightDirections = ((-1, 0), (1, 0), (0, -1), (0, 1))
 diagonalDirections = ((-1, -1), (1, 1), (1, -1), (-1, 1))
 
+
+# Precomputed target squares for every square of the board (indexed row * 8 + col),
+# so move generation and attack detection never have to bounds-check
+rayDirections = straightDirections + diagonalDirections
+
+
+def _step_squares(directions):
+    return tuple(tuple((r + dr, c + dc) for dr, dc in directions if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+                 for r in range(8) for c in range(8))
+
+
+def _ray(r, c, dr, dc):
+    squares = []
+    r, c = r + dr, c + dc
+    while 0 <= r < 8 and 0 <= c < 8:
+        squares.append((r, c))
+        r, c = r + dr, c + dc
+    return tuple(squares)
+
+
+knightSquares = _step_squares(knightDirections)
+kingSquares = _step_squares(kingDirections)
+# Squares a pawn of each color standing on the square attacks
+pawnAttackSquares = {'w': _step_squares(((-1, -1), (-1, 1))), 'b': _step_squares(((1, -1), (1, 1)))}
+# One ray per entry of rayDirections, the four straight ones first
+raySquares = tuple(tuple(_ray(r, c, dr, dc) for dr, dc in rayDirections) for r in range(8) for c in range(8))
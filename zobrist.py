@@ -0,0 +1,32 @@
+import random
+
+# Fixed seed so hashes are reproducible between runs and processes (opening books, tablebases)
+_rng = random.Random(0x5EED)
+
+PIECE_KEYS = {color + kind: [_rng.getrandbits(64) for _ in range(64)]
+              for color in "wb" for kind in "pNBRQK"}
+SIDE_KEY = _rng.getrandbits(64)  # xor-ed in when black is to move
+# Indexed by castling-rights bitmask: wks = 1, wqs = 2, bks = 4, bqs = 8
+CASTLE_KEYS = [_rng.getrandbits(64) for _ in range(16)]
+# Indexed by the file of the en passant square
+ENPASSANT_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+
+
+def castle_index(wks: bool, wqs: bool, bks: bool, bqs: bool) -> int:
+    return wks | (wqs << 1) | (bks << 2) | (bqs << 3)
+
+
+def hash_position(board, white_to_move: bool, castle_rights: int, enpassant_col: int = -1) -> int:
+    """Compute the Zobrist hash of a position from scratch."""
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != "--":
+                key ^= PIECE_KEYS[piece][r * 8 + c]
+    if not white_to_move:
+        key ^= SIDE_KEY
+    key ^= CASTLE_KEYS[castle_rights]
+    if enpassant_col >= 0:
+        key ^= ENPASSANT_KEYS[enpassant_col]
+    return key